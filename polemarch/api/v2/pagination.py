@@ -0,0 +1,164 @@
+import json
+import base64
+from collections import OrderedDict
+from functools import reduce
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.encoding import force_text
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination, coreapi, coreschema
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPagination(LimitOffsetPagination):
+    '''
+    Limit/offset pagination, which is switched to keyset (cursor) pagination
+    by `cursor` query parameter. Keyset is set by `keyset_ordering` of view,
+    which must be unique. Pages are filtered by last seen key instead of
+    offset and count of objects is omitted, so every page costs the same.
+    Empty `cursor` means first page.
+    '''
+    cursor_query_param = 'cursor'
+    cursor_query_description = (
+        'Cursor of page for keyset pagination (empty value for first page). '
+        'Objects count is not calculated in this mode.'
+    )
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def __init__(self):
+        self.ordering = None
+        self.cursor = None
+        self.has_next = False
+        self.has_previous = False
+        self.page = []
+
+    def is_keyset(self, request, view):
+        return (
+            getattr(view, 'keyset_ordering', None) is not None and
+            self.cursor_query_param in request.query_params
+        )
+
+    def encode_cursor(self, position, reverse):
+        data = json.dumps(dict(p=position, r=reverse)).encode('utf-8')
+        return force_text(base64.urlsafe_b64encode(data))
+
+    def decode_cursor(self, request):
+        value = request.query_params[self.cursor_query_param]
+        if not value:
+            return None
+        try:
+            # pylint: disable=broad-except
+            data = base64.urlsafe_b64decode(value.encode('ascii'))
+            data = json.loads(force_text(data))
+            position, reverse = list(data['p']), bool(data['r'])
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_position(self, obj):
+        position = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip('-'))
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            position.append(value)
+        return position
+
+    def get_keyset_filter(self, model, position, reverse):
+        # Values of cursor are converted by fields of keyset.
+        position = [
+            model._meta.get_field(field.lstrip('-')).to_python(value)
+            for field, value in zip(self.ordering, position)
+        ]
+        # (a, b) > (x, y) is (a > x) or (a = x and b > y).
+        conditions = []
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'gt' if field.startswith('-') == reverse else 'lt'
+            condition = Q(**{'{}__{}'.format(name, lookup): position[i]})
+            for prev_field, value in zip(self.ordering[:i], position[:i]):
+                condition &= Q(**{prev_field.lstrip('-'): value})
+            conditions.append(condition)
+        return reduce(lambda x, y: x | y, conditions)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_keyset(request, view):
+            return super(KeysetPagination, self).paginate_queryset(
+                queryset, request, view
+            )
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.ordering = list(view.keyset_ordering)
+        self.cursor = self.decode_cursor(request)
+        reverse = False
+        ordering = self.ordering
+        if self.cursor is not None:
+            position, reverse = self.cursor
+            if reverse:
+                ordering = [
+                    f[1:] if f.startswith('-') else '-' + f for f in self.ordering
+                ]
+            try:
+                queryset = queryset.filter(
+                    self.get_keyset_filter(queryset.model, position, reverse)
+                )
+            except (ValueError, TypeError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        page = list(queryset.order_by(*ordering)[:self.limit + 1])
+        has_more = len(page) > self.limit
+        page = page[:self.limit]
+        if reverse:
+            page.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = self.cursor is not None, has_more
+        self.page = page
+        return page
+
+    def get_keyset_link(self, obj, reverse):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.offset_query_param)
+        cursor = self.encode_cursor(self.get_position(obj), reverse)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if self.ordering is None:
+            return super(KeysetPagination, self).get_next_link()
+        if not (self.has_next and self.page):
+            return None
+        return self.get_keyset_link(self.page[-1], False)
+
+    def get_previous_link(self):
+        if self.ordering is None:
+            return super(KeysetPagination, self).get_previous_link()
+        if not (self.has_previous and self.page):
+            return None
+        return self.get_keyset_link(self.page[0], True)
+
+    def get_paginated_response(self, data):
+        if self.ordering is None:
+            return super(KeysetPagination, self).get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_schema_fields(self, view):
+        fields = super(KeysetPagination, self).get_schema_fields(view)
+        if getattr(view, 'keyset_ordering', None) is None:
+            return fields
+        return fields + [
+            coreapi.Field(
+                name=self.cursor_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(
+                    title='Cursor',
+                    description=force_text(self.cursor_query_description)
+                )
+            )
+        ]
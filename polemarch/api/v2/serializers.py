@@ -441,17 +441,23 @@ class ProjectVariableSerializer(VariableSerializer):
     project_keys = (
         ('repo_type', 'Types of repo. Default="MANUAL".'),
         ('repo_sync_on_run', "Sync project by every execution."),
+        ('repo_sync_on_run_timeout', "Skip sync on execution if project was synced "
+                                     "less than this number of seconds ago."),
         ('repo_branch', "[Only for GIT repos] Checkout branch on sync."),
+        ('repo_sync_check_remote', "[Only for GIT repos] Skip fetch if remote revision "
+                                   "is the same as local."),
         ('repo_password', "[Only for GIT repos] Password to fetch access."),
         ('repo_key', "[Only for GIT repos] Key to fetch access."),
     )
     key = serializers.ChoiceField(choices=project_keys)
     value = vst_fields.DependEnumField(allow_blank=True, field='key', choices={
         'repo_type': list(models.Project.repo_handlers.keys()),
-        'repo_sync_on_run': [True, False]
+        'repo_sync_on_run': [True, False],
+        'repo_sync_check_remote': [True, False],
     }, types={
         'repo_password': 'password',
-        'repo_key': 'secretfile'
+        'repo_key': 'secretfile',
+        'repo_sync_on_run_timeout': 'integer',
     })
 
 
@@ -839,10 +845,10 @@ class ProjectCreateMasterSerializer(vst_serializers.VSTSerializer):
         repo_auth_data = validated_data.pop('auth_data')
 
         instance = super(ProjectCreateMasterSerializer, self).create(validated_data)
-        instance.variables.create(key='repo_type', value=repo_type)
+        variables = OrderedDict(repo_type=repo_type)
         if repo_auth_type != 'NONE':  # nocv
-            key = 'repo_{}'.format(repo_auth_type.lower())
-            instance.variables.create(key=key, value=repo_auth_data)
+            variables['repo_{}'.format(repo_auth_type.lower())] = repo_auth_data
+        instance.set_vars(variables)
         return instance
 
 
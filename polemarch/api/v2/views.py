@@ -1,15 +1,19 @@
 # pylint: disable=unused-argument,protected-access,too-many-ancestors
+import hashlib
 from collections import OrderedDict
-from django.http import HttpResponse
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
 from django.utils.decorators import method_decorator
 from rest_framework import exceptions as excepts, status, permissions
 from rest_framework.authtoken import views as token_views
 from drf_yasg.utils import swagger_auto_schema
 from vstutils.api.permissions import StaffPermission
 from vstutils.api import base, views, serializers as vstsers, decorators as deco
-from vstutils.utils import KVExchanger
+from vstutils.utils import KVExchanger, raise_context
 
 from . import filters
+from . import pagination
 from . import serializers as sers
 from ...main import utils
 
@@ -29,15 +33,59 @@ execute_kw.update(dict(
 
 
 class _VariablesCopyMixin(base.CopyMixin):
+    @transaction.atomic()
     def copy_instance(self, instance):
+        variables = instance.vars
         new_instance = super(_VariablesCopyMixin, self).copy_instance(instance)
-        new_instance.variables.bulk_create([
-            sers.models.Variable(key=key, value=value, content_object=new_instance)
-            for key, value in instance.vars.items()
-        ])
+        new_instance.set_vars(variables)
         return new_instance
 
 
+class _ConditionalRetrieveMixin(object):
+    '''
+    Detail view with strong ETag built from version stamps, which are
+    changed by models signals. Unchanged object is not serialized
+    for request with matching `If-None-Match` header.
+    '''
+    def get_etag_parts(self, instance):
+        return [utils.VersionStamp(instance.__class__, instance.pk).get()]
+
+    def get_etag(self, instance):
+        parts = self.get_etag_parts(instance)
+        if not parts or None in parts:
+            return None
+        parts.append(self.request.build_absolute_uri())
+        return quote_etag(hashlib.sha1(
+            ':'.join(str(part) for part in parts).encode('utf-8')
+        ).hexdigest())
+
+    def get_object(self):
+        instance = getattr(self, '_conditional_object', None)
+        if instance is None:
+            instance = super(_ConditionalRetrieveMixin, self).get_object()
+        return instance
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self._conditional_object = self.get_object()
+        etag = self.get_etag(instance)
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag is not None and (etag in if_none_match or '*' in if_none_match):
+            response = HttpResponseNotModified()
+        else:
+            response = super(_ConditionalRetrieveMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+        if etag is not None:
+            response['ETag'] = etag
+        return response
+
+
+class _OwnedConditionalRetrieveMixin(_ConditionalRetrieveMixin):
+    def get_etag_parts(self, instance):
+        parts = super(_OwnedConditionalRetrieveMixin, self).get_etag_parts(instance)
+        return parts + [utils.VersionStamp(sers.models.BaseUser, instance.owner_id).get()]
+
+
 class OwnedView(base.ModelViewSetSet, base.CopyMixin):
     POST_WHITE_LIST = []
 
@@ -264,12 +312,14 @@ class __HistoryLineViewSet(base.ReadOnlyModelViewSet):
     model = sers.models.HistoryLines
     serializer_class = sers.HistoryLinesSerializer
     filter_class = filters.HistoryLinesFilter
+    pagination_class = pagination.KeysetPagination
+    keyset_ordering = ('-line_gnumber', '-line_number')
 
 
 @method_decorator(name='lines_list', decorator=swagger_auto_schema(auto_schema=None))
 @method_decorator(name='raw', decorator=swagger_auto_schema(auto_schema=None))
 @deco.nested_view('lines', manager_name='raw_history_line', view=__HistoryLineViewSet)
-class HistoryViewSet(base.HistoryModelViewSet):
+class HistoryViewSet(_ConditionalRetrieveMixin, base.HistoryModelViewSet):
     '''
 
     retrieve:
@@ -287,6 +337,14 @@ class HistoryViewSet(base.HistoryModelViewSet):
     serializer_class_one = sers.OneHistorySerializer
     filter_class = filters.HistoryFilter
     POST_WHITE_LIST = ['cancel']
+    pagination_class = pagination.KeysetPagination
+    keyset_ordering = ('-start_time', '-id')
+
+    def get_etag(self, instance):
+        # Execution time of working history is changed every second.
+        if instance.working:
+            return None
+        return super(HistoryViewSet, self).get_etag(instance)
 
     @deco.action(["get"], detail=yes, serializer_class=sers.EmptySerializer)
     def raw(self, request, *args, **kwargs):
@@ -414,7 +472,7 @@ class GroupViewSet(_BaseGroupViewSet, _GroupMixin):
 @deco.nested_view('all_groups', 'id', methods=['get'], view=GroupViewSet, subs=None)
 @deco.nested_view('all_hosts', 'id', methods=['get'], view=HostViewSet, subs=None)
 @deco.nested_view('variables', 'id', view=__InvVarsViewSet)
-class InventoryViewSet(_GroupMixin):
+class InventoryViewSet(_OwnedConditionalRetrieveMixin, _GroupMixin):
     '''
     retrieve:
         Return a inventory instance.
@@ -577,7 +635,7 @@ class __ProjectHistoryViewSet(HistoryViewSet):
 @deco.nested_view('periodic_task', 'id', view=__PeriodicTaskViewSet)
 @deco.nested_view('history', 'id', manager_name='history', view=__ProjectHistoryViewSet)
 @deco.nested_view('variables', 'id', view=__ProjectVarsViewSet)
-class ProjectViewSet(_GroupMixin):
+class ProjectViewSet(_OwnedConditionalRetrieveMixin, _GroupMixin):
     '''
     retrieve:
         Return a project instance.
@@ -611,6 +669,14 @@ class ProjectViewSet(_GroupMixin):
         instance.status = instance.__class__._meta.get_field('status').default
         return super(ProjectViewSet, self).copy_instance(instance)
 
+    def get_etag_parts(self, instance):
+        # Readme and view data are changed with files only by sync.
+        # Projects without revision (manual) could be changed any time.
+        revision = None
+        with raise_context():
+            revision = instance.repo_class.get_local_revision()
+        return super(ProjectViewSet, self).get_etag_parts(instance) + [revision]
+
     @deco.subaction(serializer_class=vstsers.EmptySerializer, **action_kw)
     def sync(self, request, *args, **kwargs):
         '''
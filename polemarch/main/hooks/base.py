@@ -1,3 +1,5 @@
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 from django.conf import settings
 
 
@@ -6,6 +8,8 @@ class BaseHook(object):
         self.when_types = when_types or []
         self.hook_object = hook_object
         self.when = None
+        self.errors = []
+        self.failed = OrderedDict()
         recipients = hook_object.reps
         self.setup(recipients=recipients, **kwargs)
 
@@ -27,16 +31,31 @@ class BaseHook(object):
     def modify_message(self, message):
         return message
 
+    def add_error(self, recipient, error):
+        error = "{}: {}".format(recipient, error)
+        self.errors.append(error)
+        self.failed[recipient] = error
+
     def execute(self, recipient, when, message):  # nocv
         raise NotImplementedError
 
     def send(self, message, when):
         self.when = when
-        filtered = filter(lambda r: r, self.conf['recipients'])
+        self.errors = []
+        self.failed = OrderedDict()
+        filtered = [r for r in self.conf['recipients'] if r]
         execute = self.execute
         message = self.modify_message(message)
-        mapping = map(lambda r: execute(r, when, message), filtered)
-        return '\n'.join(mapping)
+        workers = min(self.conf.get('WORKERS', 1), len(filtered))
+        if workers <= 1:
+            return '\n'.join(map(lambda r: execute(r, when, message), filtered))
+        # Results are kept in order of recipients.
+        pool = ThreadPool(workers)
+        try:
+            return '\n'.join(pool.map(lambda r: execute(r, when, message), filtered))
+        finally:
+            pool.close()
+            pool.join()
 
     def on_execution(self, message):
         return self.send(message, when='on_execution')
@@ -1,6 +1,11 @@
+import os
+import time
 import logging
+import threading
 import traceback
 import requests
+from requests.adapters import HTTPAdapter
+from six.moves.http_cookiejar import DefaultCookiePolicy
 from .base import BaseHook
 
 
@@ -8,16 +13,54 @@ logger = logging.getLogger("polemarch")
 
 
 class Backend(BaseHook):
+    '''
+    Post hook message to every recipient url.
+    All hooks of worker process share one session with pool
+    of keep-alive connections, which is recreated after fork.
+    '''
+    _session = None
+    _session_pid = None
+    _session_lock = threading.Lock()
+
+    def setup(self, **kwargs):
+        super(Backend, self).setup(**kwargs)
+        self.timeout = (
+            self.conf.get('CONNECT_TIMEOUT', None), self.conf.get('READ_TIMEOUT', None)
+        )
+
+    def get_session(self):
+        cls = self.__class__
+        with cls._session_lock:
+            if cls._session is None or cls._session_pid != os.getpid():
+                pool_size = max(self.conf.get('POOL_SIZE', 10), 1)
+                session = requests.Session()
+                # Recipients must not get cookies of each other.
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                cls._session, cls._session_pid = session, os.getpid()
+            return cls._session
+
     def execute(self, url, when, message):
         data = dict(type=when, payload=message)
+        started = time.time()
         try:
-            response = requests.post(url, data=data)
-            return "{} {}: {}".format(
+            response = self.get_session().post(url, data=data, timeout=self.timeout)
+            result = "{} {}: {}".format(
                 response.status_code, response.reason, response.text
             )
+            if response.status_code >= 500:
+                self.add_error(url, result)
+            return result
         except BaseException as err:
             logger.error(traceback.format_exc())
             logger.error("Details:\nURL:{}\nWHEN:{}\n".format(
                 url, when
             ))
+            self.add_error(url, err)
             return str(err)
+        finally:
+            logger.debug("Hook {} to {} took {:.3f}s.".format(
+                when, url, time.time() - started
+            ))
@@ -1,30 +1,91 @@
 from __future__ import unicode_literals
 import os
 import json
+import signal
+import tempfile
 import traceback
 import logging
+import threading
 import subprocess
+import six
+from vstutils.utils import raise_context
 from .base import BaseHook
 
 
 logger = logging.getLogger("polemarch")
 
 
+class ScriptTimeoutError(Exception):
+    pass
+
+
 class Backend(BaseHook):
 
-    def execute(self, script, when, file):
-        try:
-            work_dir = self.conf['HOOKS_DIR']
-            script = '{}/{}'.format(work_dir, script)
-            return subprocess.check_output(
-                [script, when],
-                cwd=work_dir, universal_newlines=True, input=file
+    def run_script(self, script, when, message):
+        '''
+        Run script in own process group, which is killed on timeout.
+        Output is written to temporary file, so script is never blocked
+        by full pipe, and only first `MAX_OUTPUT` bytes of it are read.
+        Size of file itself is not limited.
+        '''
+        max_output = self.conf.get('MAX_OUTPUT', None)
+        timeout = self.conf.get('TIMEOUT', None)
+        killed = threading.Event()
+        if six.PY3:
+            session_kwargs = dict(start_new_session=True)
+        else:  # nocv
+            session_kwargs = dict(preexec_fn=os.setsid)
+        with tempfile.TemporaryFile() as output:
+            proc = subprocess.Popen(
+                [script, when], cwd=self.conf['HOOKS_DIR'],
+                stdin=subprocess.PIPE, stdout=output, **session_kwargs
             )
+            timer = None
+            if timeout:
+                timer = threading.Timer(timeout, self.kill, [proc, killed])
+                timer.start()
+            try:
+                proc.stdin.write(message.encode('utf-8'))
+                proc.stdin.close()
+            except (IOError, OSError):
+                # Script could exit or be killed without reading of message.
+                with raise_context():
+                    proc.stdin.close()
+            proc.wait()
+            if timer is not None:
+                timer.cancel()
+            if killed.is_set() and proc.returncode == -signal.SIGKILL:
+                raise ScriptTimeoutError("Script {} timed out after {} seconds.".format(
+                    script, timeout
+                ))
+            output.seek(0)
+            result = output.read(max_output if max_output else -1)
+            if max_output and output.read(1):
+                logger.warning(
+                    "Output of hook script {} is truncated to {} bytes.".format(
+                        script, max_output
+                    )
+                )
+        result = result.decode('utf-8', 'replace')
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, [script, when], result)
+        return result
+
+    def kill(self, proc, killed):
+        killed.set()
+        with raise_context():
+            os.killpg(proc.pid, signal.SIGKILL)
+
+    def execute(self, recipient, when, file):
+        script = '{}/{}'.format(self.conf['HOOKS_DIR'], recipient)
+        try:
+            return self.run_script(script, when, file)
         except BaseException as err:
             logger.error(traceback.format_exc())
             logger.error("Details:\nSCRIPT:{}\nWHEN:{}\nCWD:{}\n".format(
                 script, when, self.conf['HOOKS_DIR']
             ))
+            self.add_error(recipient, err)
             return str(err)
 
     def setup(self, **kwargs):
@@ -0,0 +1,51 @@
+from __future__ import unicode_literals
+import json
+from collections import OrderedDict
+from django.db import transaction
+from ..base import ServiceCommand
+from ...models import Host, Group, Inventory, Project, PeriodicTask
+
+
+class Command(ServiceCommand):
+    help = "Check that variables snapshots are consistent with variables."
+    models = (Host, Group, Inventory, Project, PeriodicTask)
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument(
+            '--fix', action='store_true', dest='fix', default=False,
+            help='Rebuild inconsistent snapshots.'
+        )
+
+    def is_consistent(self, obj):
+        if obj.vars_snapshot is None:
+            return False
+        snapshot = json.loads(obj.vars_snapshot, object_pairs_hook=OrderedDict)
+        return list(snapshot.items()) == list(obj.build_vars_snapshot().items())
+
+    def check_model(self, model, fix):
+        inconsistent = 0
+        queryset = model._base_manager.prefetch_related('variables').order_by('id')
+        for obj in queryset:
+            if self.is_consistent(obj):
+                continue
+            inconsistent += 1
+            self._print('{} {} ({}) has inconsistent snapshot.'.format(
+                model.__name__, obj.name, obj.id
+            ), 'WARNING')
+            if fix:
+                with transaction.atomic():
+                    obj.update_vars_snapshot()
+        return inconsistent
+
+    def handle(self, *args, **options):
+        super(Command, self).handle(*args, **options)
+        inconsistent = sum(self.check_model(m, options['fix']) for m in self.models)
+        if not inconsistent:
+            self._print('All variables snapshots are consistent.', 'SUCCESS')
+        elif options['fix']:
+            self._print('Fixed {} variables snapshots.'.format(inconsistent), 'SUCCESS')
+        else:
+            raise self.CommandError(
+                'Found {} inconsistent variables snapshots.'.format(inconsistent)
+            )
@@ -0,0 +1,85 @@
+from __future__ import unicode_literals
+import time
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+from django.db import connection
+from django.db.models import Q
+from ..base import ServiceCommand
+from ...models import Project
+
+SyncResult = namedtuple('SyncResult', 'project status duration error')
+
+
+class Command(ServiceCommand):
+    help = "Sync selected or all projects in parallel."
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument(
+            'projects', nargs='*', type=str,
+            help='Ids or names of projects to sync. All projects by default.'
+        )
+        parser.add_argument(
+            '-w', '--workers', action='store', dest='workers', default=4, type=int,
+            help='Number of projects, which are synced simultaneously. Default: 4.'
+        )
+
+    def get_projects(self, projects):
+        queryset = Project.objects.all()
+        if projects:
+            ids = [int(p) for p in projects if p.isdigit()]
+            queryset = queryset.filter(Q(id__in=ids) | Q(name__in=projects))
+        return list(queryset.order_by('id'))
+
+    def sync_project(self, project):
+        # pylint: disable=broad-except
+        started = time.time()
+        try:
+            project.sync()
+        except Exception as err:
+            return SyncResult(project, 'ERROR', time.time() - started, str(err))
+        finally:
+            # Every worker thread has own database connection.
+            connection.close() if self.workers > 1 else None
+        return SyncResult(project, 'OK', time.time() - started, None)
+
+    def _print_result(self, number, total, result):
+        self._print('[{:>{width}}/{}] {:<5} {:>8.2f}s  {} ({})'.format(
+            number, total, result.status, result.duration,
+            result.project.name, result.project.id, width=len(str(total))
+        ), 'SUCCESS' if result.status == 'OK' else 'ERROR')
+
+    def handle(self, *args, **options):
+        super(Command, self).handle(*args, **options)
+        self.workers = max(options['workers'], 1)
+        projects = self.get_projects(options['projects'])
+        if not projects:
+            raise self.CommandError('No projects to sync.')
+        total = len(projects)
+        self._print('Sync {} projects with {} workers.'.format(total, self.workers))
+        started = time.time()
+        pool = ThreadPool(self.workers) if self.workers > 1 else None
+        try:
+            results_iter = (
+                pool.imap_unordered(self.sync_project, projects)
+                if pool else map(self.sync_project, projects)
+            )
+            results = []
+            for number, result in enumerate(results_iter, 1):
+                results.append(result)
+                self._print_result(number, total, result)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        failed = [r for r in results if r.status != 'OK']
+        summary = 'Synced {} of {} projects in {:.2f}s.'.format(
+            total - len(failed), total, time.time() - started
+        )
+        if failed:
+            for result in failed:
+                self._print('{} ({}): {}'.format(
+                    result.project.name, result.project.id, result.error
+                ), 'ERROR')
+            raise self.CommandError('{} Failed: {}.'.format(summary, len(failed)))
+        self._print(summary, 'SUCCESS')
@@ -1,30 +1,84 @@
+import time
 from django.db import transaction
 from ..base import ServiceCommand
 from ...utils import AnsibleModules
-from ...models import Module
+from ...models import Module, Project
 
 
 class Command(ServiceCommand):
     help = "Update ansible modules. Needs when ansible version updated."
     interactive = True
+    batch_size = 500
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument(
+            '-y', '--yes', action='store_true', dest='yes', default=False,
+            help='Update modules without confirmation.'
+        )
+        parser.add_argument(
+            '--load-docs', action='store_true', dest='load_docs', default=False,
+            help='Load docs of all modules without docs now instead of background task.'
+        )
+        parser.add_argument(
+            '-w', '--workers', action='store', dest='workers', default=4, type=int,
+            help='Number of simultaneous docs loaders. Default: 4.'
+        )
+
+    def _delete(self, pks):
+        for i in range(0, len(pks), self.batch_size):
+            Module.objects.filter(pk__in=pks[i:i + self.batch_size]).delete()
 
-    @transaction.atomic()
     def update_modules(self):
-        try:
-            modules = AnsibleModules(detailed=False)
-            modules.clear_cache()
-            modules_list = modules.all()
-            modules_list.sort()
-            Module.objects.filter(project=None).delete()
+        '''
+        Reconcile global modules with installed ansible modules.
+        Existing modules and their docs are kept, docs are dropped
+        only for modules which source was changed.
+        '''
+        started = time.time()
+        modules = AnsibleModules(detailed=False)
+        modules.clear_cache()
+        found = {path: modules.get_source_hash(path) for path in modules.all()}
+        search_time = time.time() - started
+        with transaction.atomic():
+            existed = Module.objects.filter(project=None).values_list(
+                'pk', 'path', 'source_hash'
+            )
+            existed_paths, removed, changed = set(), [], []
+            for pk, path, source_hash in existed:
+                existed_paths.add(path)
+                if path not in found:
+                    removed.append(pk)
+                elif found[path] != source_hash:
+                    changed.append(path)
+                    Module.objects.filter(pk=pk).update(
+                        _data='{}', source_hash=found[path]
+                    )
+            self._delete(removed)
+            added = sorted(set(found.keys()) - existed_paths)
             Module.objects.bulk_create([
-                Module(path=module, project=None) for module in modules_list
-            ])
-        except:  # nocv
-            raise
-        else:
-            self._print('The modules have been successfully updated.', 'SUCCESS')
+                Module(path=path, project=None, source_hash=found[path])
+                for path in added
+            ], batch_size=self.batch_size)
+        self._print('The modules have been successfully updated.', 'SUCCESS')
+        self._print(
+            'Added: {}, removed: {}, changed: {}, unchanged: {}. '
+            'Search: {:.2f}s, update: {:.2f}s.'.format(
+                len(added), len(removed), len(changed),
+                len(found) - len(added) - len(changed),
+                search_time, time.time() - started - search_time
+            )
+        )
+
+    def load_docs(self, workers):
+        updated = Module.objects.all().load_docs(workers=workers)
+        self._print('Docs of {} modules have been loaded.'.format(updated), 'SUCCESS')
 
     def handle(self, *args, **options):
         super(Command, self).handle(*args, **options)
-        if self.ask_user_bool("Update ansible modules?[y/n]:"):
+        if options['load_docs']:
+            self.load_docs(options['workers'])
+        elif options['yes'] or self.ask_user_bool("Update ansible modules?[y/n]:"):
             self.update_modules()
+            docs_task = Project.task_handlers.backend("MODULES_DOCS")
+            docs_task.delay(workers=options['workers'])
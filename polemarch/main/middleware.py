@@ -1,4 +1,5 @@
 from vstutils.middleware import BaseMiddleware
+from .models import HookEventsBatch
 
 
 class PolemarchHeadersMiddleware(BaseMiddleware):
@@ -7,3 +8,10 @@ class PolemarchHeadersMiddleware(BaseMiddleware):
         response['Polemarch-Version'] = self.get_setting('POLEMARCH_VERSION')
         response['Polemarch-Timezone'] = self.get_setting('TIME_ZONE')
         return response
+
+
+class HooksBatchMiddleware(BaseMiddleware):
+    def __call__(self, request):
+        # Object events of request are sent as one batch.
+        with HookEventsBatch.collect():
+            return super(HooksBatchMiddleware, self).__call__(request)
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_projecttemplate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='module',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def remove_duplicates(apps, schema_editor):
+    Variable = apps.get_model('main', 'Variable')
+    duplicates = Variable.objects.order_by().values(
+        'content_type', 'object_id', 'key'
+    ).annotate(last_id=models.Max('id'), count=models.Count('id')).filter(count__gt=1)
+    for duplicate in duplicates.iterator():
+        last_id = duplicate.pop('last_id')
+        duplicate.pop('count')
+        Variable.objects.filter(**duplicate).exclude(id=last_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_module_source_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='variable',
+            unique_together=set([('content_type', 'object_id', 'key')]),
+        ),
+    ]
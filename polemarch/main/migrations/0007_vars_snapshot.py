@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+from collections import OrderedDict
+from django.db import migrations, models
+
+MODELS = ('host', 'group', 'inventory', 'project', 'periodictask')
+VARIABLES_KEYS = [
+    'ansible_host', 'ansible_port', 'ansible_user', 'ansible_connection',
+    'ansible_ssh_pass', 'ansible_ssh_private_key_file', 'ansible_ssh_common_args',
+    'ansible_sftp_extra_args', 'ansible_scp_extra_args', 'ansible_ssh_extra_args',
+    'ansible_ssh_executable', 'ansible_ssh_pipelining',
+    'ansible_become', 'ansible_become_method', 'ansible_become_user',
+    'ansible_become_pass', 'ansible_become_exe', 'ansible_become_flags',
+    'ansible_shell_type', 'ansible_python_interpreter', 'ansible_ruby_interpreter',
+    'ansible_perl_interpreter', 'ansible_shell_executable',
+]
+
+
+def sort_index(item):
+    key = item[0]
+    if key in VARIABLES_KEYS:
+        return VARIABLES_KEYS.index(key), key
+    return (99 if key.startswith('ansible_') else 100), key
+
+
+def build_snapshots(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Variable = apps.get_model('main', 'Variable')
+    for model_name in MODELS:
+        model = apps.get_model('main', model_name)
+        content_type = ContentType.objects.filter(app_label='main', model=model_name).first()
+        if content_type is None:
+            continue
+        variables = dict()
+        qs = Variable.objects.filter(content_type=content_type)
+        for object_id, key, value in qs.values_list('object_id', 'key', 'value').iterator():
+            variables.setdefault(object_id, []).append((key, value))
+        for object_id in model.objects.values_list('id', flat=True).iterator():
+            items = variables.get(object_id, [])
+            items.sort(key=(lambda i: i[0]) if model_name == 'periodictask' else sort_index)
+            model.objects.filter(id=object_id).update(
+                vars_snapshot=json.dumps(OrderedDict(items))
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_variable_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name=model_name,
+            name='vars_snapshot',
+            field=models.TextField(default=None, editable=False, null=True),
+        )
+        for model_name in MODELS
+    ] + [
+        migrations.RunPython(build_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_vars_snapshot'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='variable',
+            index_together=set([('content_type', 'key')]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_variable_key_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HookEvent',
+            fields=[
+                ('id', models.AutoField(max_length=20, primary_key=True, serialize=False)),
+                ('hidden', models.BooleanField(default=False)),
+                ('when', models.CharField(max_length=32)),
+                ('message', models.TextField()),
+                ('hooks', models.TextField(default=None, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
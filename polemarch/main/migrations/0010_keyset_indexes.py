@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_hookevent'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='history',
+            index_together=set([('start_time', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='historylines',
+            index_together=set([('history', 'line_gnumber', 'line_number')]),
+        ),
+    ]
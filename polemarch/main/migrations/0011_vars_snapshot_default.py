@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='group',
+            name='vars_snapshot',
+            field=models.TextField(default='{}', editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='host',
+            name='vars_snapshot',
+            field=models.TextField(default='{}', editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='inventory',
+            name='vars_snapshot',
+            field=models.TextField(default='{}', editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='periodictask',
+            name='vars_snapshot',
+            field=models.TextField(default='{}', editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='vars_snapshot',
+            field=models.TextField(default='{}', editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_vars_snapshot_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hookevent',
+            name='updated',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -11,17 +11,18 @@ from django.dispatch import receiver
 from django.db.models.functions import Cast
 from django.core.validators import ValidationError
 from django.conf import settings
+from django.db import transaction
 from vstutils.utils import raise_context
 
-from .vars import Variable
+from .vars import Variable, vars_updated
 from .hosts import Host, Group, Inventory
 from .projects import Project, Task, Module, ProjectTemplate, list_to_choices
 from .users import BaseUser, UserGroup, ACLPermission, UserSettings
 from .tasks import PeriodicTask, History, HistoryLines, Template
-from .hooks import Hook
+from .hooks import Hook, HookEvent, HookEventsBatch, HooksCache
 from ..validators import RegexValidator, validate_hostname
 from ..exceptions import UnknownTypeException
-from ..utils import AnsibleArgumentsReference
+from ..utils import AnsibleArgumentsReference, VersionStamp
 
 
 logger = logging.getLogger('polemarch')
@@ -39,6 +40,8 @@ def send_hook(when, target):
 
 @raise_context()
 def send_user_hook(when, instance):
+    if not Hook.objects.has_hooks(when):
+        return
     send_hook(
         when, OrderedDict(
             user_id=instance.id,
@@ -50,8 +53,16 @@ def send_user_hook(when, instance):
 
 @raise_context()
 def send_polemarch_models(when, instance, **kwargs):
+    coalesce = getattr(settings, 'HOOKS_COALESCE', False)
+    # Coalesced events of all types are needed to deduplicate objects.
+    whens = HookEventsBatch.when_types if coalesce else (when,)
+    if not any(Hook.objects.has_hooks(w) for w in whens):
+        return
     target = OrderedDict(id=instance.id, name=instance.name, **kwargs)
-    send_hook(when, target)
+    if not coalesce:
+        return send_hook(when, target)
+    target['type'] = instance.__class__.__name__
+    HookEventsBatch.add(when, (target['type'], instance.id), target)
 
 
 def raise_linked_error(exception_class=ValidationError, **kwargs):
@@ -61,15 +72,40 @@ def raise_linked_error(exception_class=ValidationError, **kwargs):
 #####################################
 # SIGNALS
 #####################################
-@receiver(signals.post_save, sender=Variable)
-def remove_existed(instance, **kwargs):
+@receiver([signals.post_save, signals.post_delete], sender=Variable)
+def update_vars_snapshot(instance, **kwargs):
     if 'loaddata' in sys.argv or kwargs.get('raw', False):  # nocv
         return
-    Variable.objects.filter(
-        object_id=instance.object_id,
-        content_type=instance.content_type,
-        key=instance.key
-    ).exclude(pk=instance.id).delete()
+    content_object = instance.content_object
+    if content_object is not None:
+        content_object.update_vars_snapshot()
+
+
+@receiver([signals.post_save, signals.post_delete], sender=Variable)
+@receiver([signals.post_save, signals.post_delete], sender=Project)
+@receiver([signals.post_save, signals.post_delete], sender=Inventory)
+@receiver([signals.post_save, signals.post_delete], sender=History)
+@receiver([signals.post_save, signals.post_delete], sender=BaseUser)
+def update_version_stamp(instance, **kwargs):
+    if 'loaddata' in sys.argv or kwargs.get('raw', False):  # nocv
+        return
+    if isinstance(instance, Variable):
+        # Only variables of stamped models change their stamps.
+        if instance.content_type.model_class() not in (Project, Inventory, History):
+            return
+        instance = instance.content_object
+        if instance is None:
+            return
+    stamp = VersionStamp(instance.__class__, instance.pk)
+    stamp.update()
+    # Old data could be read with new stamp until commit.
+    transaction.on_commit(stamp.update)
+
+
+@receiver(vars_updated)
+def update_vars_version_stamp(instance, **kwargs):
+    if isinstance(instance, (Project, Inventory, History)):
+        update_version_stamp(instance)
 
 
 @receiver(signals.pre_save, sender=Variable)
@@ -77,12 +113,8 @@ def check_variables_values(instance, *args, **kwargs):
     if 'loaddata' in sys.argv or kwargs.get('raw', False):  # nocv
         return
     content_object = instance.content_object
-    if isinstance(content_object, PeriodicTask):
-        cmd = "module" if content_object.kind == "MODULE" else "playbook"
-        AnsibleArgumentsReference().validate_args(cmd, {instance.key: instance.value})
-    elif isinstance(content_object, Host):
-        if instance.key == 'ansible_host':
-            validate_hostname(instance.value)
+    if content_object is not None:
+        content_object.validate_vars({instance.key: instance.value})
 
 
 @receiver(signals.pre_save, sender=Group)
@@ -179,7 +211,9 @@ def validate_template_args(instance, **kwargs):
 @receiver(signals.pre_delete, sender=Project)
 @raise_context()
 def clean_dirs(instance, **kwargs):
-    instance.repo_class.delete()
+    repo = instance.repo_class
+    repo.delete()
+    repo.snapshots.delete()
 
 
 @receiver(signals.post_save, sender=PeriodicTask)
@@ -271,6 +305,11 @@ def check_hook(instance, **kwargs):
         raise ValidationError(errors)
 
 
+@receiver([signals.post_save, signals.post_delete], sender=Hook)
+def reset_hooks_cache(instance, **kwargs):
+    HooksCache.changed()
+
+
 @receiver([signals.post_save, signals.post_delete], sender=BaseUser,
           dispatch_uid='user_add_hook')
 def user_add_hook(instance, **kwargs):
@@ -311,6 +350,13 @@ def polemarch_hook(instance, **kwargs):
     send_polemarch_models(when, instance)
 
 
+@receiver(vars_updated)
+def polemarch_vars_hook(instance, **kwargs):
+    if 'loaddata' in sys.argv:  # nocv
+        return
+    send_polemarch_models("on_object_upd", instance)
+
+
 @receiver(signals.post_save, sender=BaseUser)
 def create_settings_for_user(instance, **kwargs):
     if 'loaddata' in sys.argv or kwargs.get('raw', False):  # nocv
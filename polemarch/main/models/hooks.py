@@ -1,7 +1,16 @@
 from __future__ import unicode_literals
 import logging
 import collections
+import traceback
+import json
 import uuid
+import threading
+import contextlib
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction, connection
+from django.utils import timezone
 from vstutils.utils import raise_context, ModelHandlers
 from .base import BModel, BQuerySet, models
 
@@ -40,8 +49,20 @@ class HooksQuerySet(BQuerySet):
     def when(self, when):
         return self.filter(enable=True).filter(models.Q(when=when) | models.Q(when=None))
 
+    def has_hooks(self, when):
+        '''
+        Check that any enabled hook matches event
+        before message of event is built.
+        '''
+        return bool(HooksCache.get(when))
+
     def execute(self, when, message):
-        for hook in self.when(when):
+        hooks = self.when(when) if self.query.has_filters() else HooksCache.get(when)
+        if not hooks:
+            return
+        if getattr(settings, 'HOOKS_ASYNC', False):
+            return HookEvent.objects.enqueue(when, message)
+        for hook in hooks:
             with raise_context():
                 hook.run(when, message)
 
@@ -65,3 +86,387 @@ class Hook(BModel):
             self.handlers.handle(self, when, message)
             if self.when is None or self.when == when else ''
         )
+
+    def deliver(self, when, message, recipients=None):
+        '''
+        Send message to recipients.
+
+        :param recipients: -- recipients to send to (None - all recipients).
+        :return: -- errors of failed recipients by recipients.
+        :rtype: dict
+        '''
+        if self.when is not None and self.when != when:  # nocv
+            return dict()
+        handler = self.handlers.get_handler(self)
+        if recipients is not None:
+            handler.conf['recipients'] = [
+                r for r in handler.conf['recipients'] if r in recipients
+            ]
+        getattr(handler, when)(message)
+        return handler.failed
+
+
+class HooksCache(object):
+    '''
+    Enabled hooks of worker process grouped by `when`.
+    Hooks signals drop cache of current process and change version
+    in shared cache, so other processes reload hooks too.
+    Transaction, which changes hooks, reads them from database
+    until commit to keep uncommitted hooks out of cache.
+    '''
+    version_key = 'polemarch-hooks-version'
+    data = None
+    lock = threading.Lock()
+    local = threading.local()
+
+    @classmethod
+    def get_version(cls):
+        return caches['default'].get(cls.version_key)
+
+    @classmethod
+    def changed_in_transaction(cls):
+        if not connection.in_atomic_block:
+            # Mark of rolled back transaction is outdated.
+            cls.local.changed = False
+        return getattr(cls.local, 'changed', False)
+
+    @classmethod
+    def reset(cls):
+        cls.local.changed = False
+        caches['default'].set(cls.version_key, uuid.uuid4().hex, None)
+        with cls.lock:
+            cls.data = None
+
+    @classmethod
+    def changed(cls):
+        cls.reset()
+        if connection.in_atomic_block:
+            cls.local.changed = True
+            # Callback of rolled back savepoint is dropped, so it is added every time.
+            transaction.on_commit(cls.reset)
+
+    @classmethod
+    def load(cls):
+        # Version is read before hooks, so concurrent change reloads them again.
+        version, hooks = cls.get_version(), collections.defaultdict(list)
+        for hook in Hook.objects.filter(enable=True).order_by('id'):
+            hooks[hook.when].append(hook)
+        return version, dict(hooks)
+
+    @classmethod
+    def get(cls, when):
+        if cls.changed_in_transaction():
+            return list(Hook.objects.when(when).order_by('id'))
+        data = cls.data
+        if data is None or data[0] != cls.get_version():
+            data = cls.load()
+            with cls.lock:
+                cls.data = data
+        hooks = data[1].get(when, []) + data[1].get(None, [])
+        return sorted(hooks, key=lambda hook: hook.id)
+
+
+class HookEventQuerySet(BQuerySet):
+    use_for_related_fields = True
+    task_handlers = ModelHandlers("TASKS_HANDLERS", "Unknown execution type!")
+
+    def enqueue(self, when, message):
+        '''
+        Save event to outbox and start delivery task after commit.
+        Events, which task was not started (e.g. broker is not available),
+        are delivered by `sweep`.
+        '''
+        event = self.create(when=when, message=json.dumps(message))
+        transaction.on_commit(raise_context()(event.start_delivery))
+        return event
+
+    def sweep(self, age):
+        '''
+        Restart delivery of events, which were not tried for `age` seconds.
+
+        :return: -- number of restarted events.
+        :rtype: int
+        '''
+        now = timezone.now()
+        outdated = self.filter(updated__lt=now - timedelta(seconds=age))
+        with transaction.atomic():
+            events = list(outdated.select_for_update())
+            # Events claimed by delivery meanwhile are not restarted.
+            outdated.filter(id__in=[event.id for event in events]).update(updated=now)
+        for event in events:
+            with raise_context():
+                event.start_delivery()
+        return len(events)
+
+    def claim(self, event_id):
+        '''
+        Claim event for delivery, so it is not delivered by concurrent task.
+        Claimed event has `updated` at the end of delivery lease
+        and is not swept until it expires.
+
+        :return: -- event or None if it is delivered or claimed already.
+        :rtype: HookEvent, None
+        '''
+        now = timezone.now()
+        lease = now + timedelta(seconds=getattr(settings, 'HOOKS_SWEEP_INTERVAL', 600))
+        with transaction.atomic():
+            event = self.select_for_update().filter(id=event_id, updated__lte=now).first()
+            if event is None:
+                return None
+            claimed = self.filter(id=event.id, updated=event.updated).update(
+                updated=lease
+            )
+        if not claimed:  # nocv
+            return None
+        event.updated = lease
+        return event
+
+
+class HookEvent(BModel):
+    '''
+    Outbox of hooks events, which are delivered by background task.
+    '''
+    objects = HookEventQuerySet.as_manager()
+    task_handlers = objects._queryset_class.task_handlers
+    when       = models.CharField(max_length=32)
+    message    = models.TextField()
+    # JSON dict of not delivered recipients by hooks ids (NULL - all hooks).
+    hooks      = models.TextField(null=True, default=None)
+    attempts   = models.IntegerField(default=0)
+    created    = models.DateTimeField(default=timezone.now, db_index=True)
+    # Time of last delivery attempt or start of it,
+    # end of delivery lease while event is delivered.
+    updated    = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def start_delivery(self):
+        return self.task_handlers.backend("HOOKS").delay(self.id)
+
+    def get_message(self):
+        return json.loads(self.message, object_pairs_hook=collections.OrderedDict)
+
+    def get_pending(self):
+        '''
+        Not delivered recipients by hooks ids (None - all recipients of hook).
+
+        :rtype: dict, None
+        '''
+        if self.hooks is None:
+            return None
+        pending = json.loads(self.hooks)
+        if isinstance(pending, list):
+            return {hook_id: None for hook_id in pending}
+        return {int(hook_id): recipients for hook_id, recipients in pending.items()}
+
+    def deliver(self):
+        '''
+        Deliver event to not delivered recipients of hooks.
+        Event is removed if all recipients were delivered.
+
+        :return: -- errors of failed hooks by hooks.
+        :rtype: dict
+        '''
+        hooks, pending = Hook.objects.when(self.when), self.get_pending()
+        if pending is not None:
+            hooks = hooks.filter(id__in=list(pending.keys()))
+        message, failed = self.get_message(), collections.OrderedDict()
+        not_delivered = dict()
+        for hook in hooks:
+            recipients = pending.get(hook.id, None) if pending is not None else None
+            try:
+                errors = hook.deliver(self.when, message, recipients)
+            except Exception:  # pylint: disable=broad-except
+                errors = {None: traceback.format_exc()}
+            if errors:
+                failed[hook] = list(errors.values())
+                # Recipients of failed hook are all pending recipients.
+                not_delivered[hook.id] = (
+                    recipients if None in errors else list(errors.keys())
+                )
+        if not failed:
+            self.delete()
+            return failed
+        self.hooks = json.dumps(not_delivered)
+        self.attempts += 1
+        self.updated = timezone.now()
+        self.save(update_fields=['hooks', 'attempts', 'updated'])
+        return failed
+
+
+@contextlib.contextmanager
+def _null_context():
+    yield
+
+
+class _Savepoint(object):
+    '''
+    Marker of event in commit callbacks, which is dropped
+    with callbacks of rolled back savepoint and called on commit.
+    '''
+    __slots__ = 'committed',
+
+    def __init__(self):
+        self.committed = False
+
+    def __call__(self):
+        self.committed = True
+
+
+class HookEventsBatch(object):
+    '''
+    Object events of block, which are sent at the end of block
+    as batched hook messages with list of affected objects.
+    Every object is mentioned once: updates of objects created in
+    the same block are skipped and objects created and deleted
+    in the same block are not sent at all.
+
+    Block is `atomic` transaction, which messages are sent on commit
+    and with `HOOKS_ASYNC` are saved to outbox right before commit,
+    or `collect` block without transaction (e.g. API request).
+    Nested blocks of the same transaction are merged to outer one.
+    Events of rolled back savepoints inside block are dropped.
+    Events out of blocks are sent one by one.
+    '''
+    __slots__ = 'atomic_block', 'sids', 'entries', 'events'
+
+    local = threading.local()
+    when_types = ('on_object_add', 'on_object_upd', 'on_object_del')
+
+    def __init__(self, atomic_block=False):
+        self.atomic_block = atomic_block
+        self.sids = tuple(connection.savepoint_ids)
+        self.entries = []
+        self.events = []
+
+    @classmethod
+    def get_stack(cls):
+        if not hasattr(cls.local, 'stack'):
+            cls.local.stack = []
+        return cls.local.stack
+
+    @classmethod
+    @contextlib.contextmanager
+    def collect(cls, atomic_block=False):
+        '''
+        Collect object events of block and send them at the end of it.
+
+        :param atomic_block: -- run block in transaction.
+        '''
+        stack = cls.get_stack()
+        with transaction.atomic() if atomic_block else _null_context():
+            batch = cls(atomic_block)
+            stack.append(batch)
+            try:
+                yield batch
+            finally:
+                stack.pop()
+            parent = stack[-1] if stack else None
+            if parent is not None and (parent.atomic_block or not atomic_block):
+                parent.merge(batch)
+            else:
+                batch.flush()
+
+    @classmethod
+    def atomic(cls):
+        return cls.collect(atomic_block=True)
+
+    @classmethod
+    def add(cls, when, key, target):
+        stack = cls.get_stack()
+        # Single event is committed or rolled back with its savepoint.
+        batch = stack[-1] if stack else cls(atomic_block=True)
+        batch.entries.append((batch.get_marker(), when, key, target))
+        if not stack:
+            batch.flush()
+
+    def merge(self, batch):
+        # Events of nested block are committed with current savepoint.
+        marker = self.get_marker()
+        self.entries.extend(
+            (event_marker or marker, when, key, target)
+            for event_marker, when, key, target in batch.entries
+        )
+
+    def get_marker(self):
+        '''
+        Marker of event, which commit is not known by block.
+
+        :return: -- marker or None if event is committed with block.
+        '''
+        if not connection.in_atomic_block:
+            return None
+        sids = tuple(connection.savepoint_ids)
+        if self.atomic_block and sids == self.sids:
+            return None
+        marker = _Savepoint()
+        transaction.on_commit(marker)
+        return marker
+
+    def get_markers(self):
+        return [marker for marker, _, _, _ in self.entries if marker is not None]
+
+    def get_events(self, unconfirmed=False):
+        '''
+        Coalesced events by types.
+
+        :param unconfirmed: -- include events, which commit is not known yet.
+        '''
+        events = collections.OrderedDict(
+            (when, collections.OrderedDict()) for when in self.when_types
+        )
+        added, updated, deleted = events.values()
+        for marker, when, key, target in self.entries:
+            if not (marker is None or marker.committed or unconfirmed):
+                continue
+            if when == 'on_object_del':
+                updated.pop(key, None)
+                if added.pop(key, None) is None:
+                    deleted[key] = target
+            elif when == 'on_object_add':
+                added[key] = target
+            elif key not in added:
+                updated[key] = target
+        return events
+
+    def get_messages(self, unconfirmed=False):
+        batch_size = max(getattr(settings, 'HOOKS_BATCH_SIZE', 100), 1)
+        for when, targets in self.get_events(unconfirmed).items():
+            targets = list(targets.values())
+            for i in range(0, len(targets), batch_size):
+                message = collections.OrderedDict(when=when)
+                message['targets'] = targets[i:i + batch_size]
+                yield when, message
+
+    def flush(self):
+        '''
+        Send messages of block. In transaction messages are sent
+        on commit, but asynchronous messages are saved to outbox at once,
+        so they are committed or rolled back together with objects.
+        '''
+        if not connection.in_atomic_block:
+            return self.send()
+        if not getattr(settings, 'HOOKS_ASYNC', False):
+            # Markers are called on commit before callbacks registered after them.
+            transaction.on_commit(self.send)
+            return
+        if self.get_markers():
+            transaction.on_commit(self.confirm)
+        # Commit of nested savepoints is not known yet, so it is checked on commit.
+        for when, message in self.get_messages(unconfirmed=True):
+            event = Hook.objects.all().execute(when, message)
+            if event is not None:
+                self.events.append(event)
+
+    def confirm(self):
+        '''
+        Replace outbox events, if some events of block were rolled back.
+        '''
+        if all(marker.committed for marker in self.get_markers()):
+            return
+        # Delivery of removed events is skipped.
+        HookEvent.objects.filter(id__in=[event.id for event in self.events]).delete()
+        self.send()
+
+    def send(self):
+        for when, message in self.get_messages():
+            with raise_context():
+                Hook.objects.all().execute(when, message)
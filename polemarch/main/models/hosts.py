@@ -13,7 +13,7 @@ from .base import models
 from .base import ManyToManyFieldACL, ManyToManyFieldACLReverse
 from .vars import AbstractModel, AbstractVarsQuerySet
 from ...main import exceptions as ex
-from ..validators import RegexValidator
+from ..validators import RegexValidator, validate_hostname
 
 logger = logging.getLogger("polemarch")
 
@@ -73,6 +73,10 @@ class Host(AbstractModel):
     def __unicode__(self):
         return "{}".format(self.name)  # nocv
 
+    def validate_vars(self, variables):
+        if 'ansible_host' in variables:
+            validate_hostname(variables['ansible_host'])
+
     def toDict(self):
         hvars, keys = self.get_generated_vars()
         return hvars or None, keys
@@ -126,7 +130,7 @@ class Group(AbstractModel):
         objs_dict, obj_keys = _get_dict(objs.all(), keys)
         if objs_dict:
             result[key_name] = objs_dict
-        if self.vars:
+        if hvars:
             result['vars'] = hvars
         keys += obj_keys
         return result, keys
@@ -5,12 +5,14 @@ import os
 import logging
 import traceback
 import uuid
+from multiprocessing.pool import ThreadPool
 import six
 import requests
 from docutils.core import publish_parts as rst_gen
 from markdown2 import Markdown
 from django.conf import settings
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, Case, When, Value
 from django.core.validators import ValidationError
 from django.core.cache import caches
 from vstutils.utils import ModelHandlers, raise_context
@@ -27,7 +29,9 @@ from .vars import AbstractModel, AbstractVarsQuerySet, models
 from ..exceptions import PMException
 from .base import ManyToManyFieldACL, BQuerySet, BModel
 from .hooks import Hook
-from ..utils import AnsibleModules, AnsibleConfigParser, SubCacheInterface
+from ..utils import (
+    AnsibleModules, AnsibleModulesDocs, AnsibleConfigParser, SubCacheInterface
+)
 
 
 logger = logging.getLogger("polemarch")
@@ -65,11 +69,20 @@ class Project(AbstractModel):
         pass
 
     class ReadMe(object):
-        __slots__ = 'path', 'ext', 'content', 'file_name'
+        '''
+        Rendered README of project. Rendered content is cached by
+        project id and invalidated when revision or README file is changed.
+        '''
+        __slots__ = 'path', 'ext', 'content', 'file_name', 'cache', 'revision'
 
         def __init__(self, project):
             self.path = project.path
             self.ext = None
+            self.file_name = None
+            self.cache = project.get_yaml_subcache('readme')
+            self.revision = None
+            with raise_context():
+                self.revision = project.repo_class.get_local_revision()
             self.content = self.set_readme()
 
         def _make_ext(self, file_name):
@@ -88,6 +101,10 @@ class Project(AbstractModel):
         def _make_md(self, file):
             return Markdown(extras=['tables', 'header-ids']).convert(self._read(file))
 
+        def _render(self):
+            with open(self.file_name) as fd:
+                return getattr(self, '_make_{}'.format(str(self.ext)[1:]), str)(fd)
+
         def set_readme(self):
             if not os.path.exists(self.path):
                 return
@@ -97,9 +114,18 @@ class Project(AbstractModel):
                 if file.lower() == 'readme.rst':
                     self._make_ext(file)
                     break
-            if self.ext is not None:
-                with open(self.file_name) as fd:
-                    return getattr(self, '_make_{}'.format(str(self.ext)[1:]), str)(fd)
+            if self.ext is None:
+                return
+            stat = os.stat(self.file_name)
+            key = '{}:{}:{}:{}'.format(
+                self.revision, self.file_name, stat.st_mtime, stat.st_size
+            )
+            cached = self.cache.get()
+            if cached and cached.get('key', None) == key:
+                return cached['content']
+            content = self._render()
+            self.cache.set(dict(key=key, content=content))
+            return content
 
     HIDDEN_VARS = [
         'repo_password',
@@ -107,7 +133,8 @@ class Project(AbstractModel):
     ]
 
     BOOLEAN_VARS = [
-        'repo_sync_on_run'
+        'repo_sync_on_run',
+        'repo_sync_check_remote',
     ]
 
     EXTRA_OPTIONS = {
@@ -154,15 +181,11 @@ class Project(AbstractModel):
 
     @property
     def repo_class(self):
-        repo_type = self.vars.get("repo_type", "MANUAL")
-        return self.repo_handlers(repo_type, self)
+        return self.repo_handlers(self.type, self)
 
     @property
     def type(self):
-        try:
-            return self.variables.get(key="repo_type").value
-        except self.variables.model.DoesNotExist:  # nocv
-            return 'MANUAL'
+        return self.vars.get("repo_type", "MANUAL")
 
     @property
     def config(self):
@@ -260,10 +283,12 @@ class Project(AbstractModel):
         Hook.objects.all().execute(when, msg)
 
     def sync_on_execution_handler(self, history):
-        if not self.vars.get('repo_sync_on_run', False):
+        project_vars = self.vars
+        if not project_vars.get('repo_sync_on_run', False):
             return
         try:
-            self.sync()
+            timeout = int(project_vars.get('repo_sync_on_run_timeout', 0) or 0)
+            self.repo_class.sync_on_run(timeout)
         except Exception as exc:  # nocv
             raise self.SyncError("ERROR on Sync operation: " + str(exc))
 
@@ -284,6 +309,33 @@ class Project(AbstractModel):
         self.status = status
         self.save()
 
+    def pin_snapshot(self):
+        snapshots = self.repo_class.snapshots
+        return snapshots.pin() if snapshots.enabled else None
+
+    def release_snapshot(self, pin):
+        self.repo_class.snapshots.release(pin)
+
+    @raise_context()
+    def get_snapshot_revision(self, pin):
+        '''
+        Revision of pinned snapshot, which differs from current revision
+        if project was synced after pin.
+        '''
+        if pin is None:
+            return self.revision
+        return self.repo_class.get_snapshot_revision(pin.key)
+
+    def get_modules_paths(self):
+        '''
+        Paths of modules from ansible config, which are in project dir.
+        '''
+        paths = self.config.get('DEFAULT_MODULE_PATH', [])
+        return list(filter(lambda mp: self.path in mp, paths))
+
+    def start_modules_docs_task(self):
+        return self.task_handlers.backend("MODULES_DOCS").delay(self.id)
+
     def start_repo_task(self, operation='sync'):
         if self.status == 'NEW':
             operation = 'clone'
@@ -291,10 +343,14 @@ class Project(AbstractModel):
         return self.task_handlers.backend("REPO").delay(self, operation)
 
     def sync(self, *args, **kwargs):
-        return self.repo_class.get()
+        repo = self.repo_class
+        with repo.sync_lock():
+            return repo.get()
 
     def clone(self, *args, **kwargs):
-        return self.repo_class.clone()
+        repo = self.repo_class
+        with repo.sync_lock():
+            return repo.clone()
 
     @property
     @raise_context()
@@ -316,6 +372,12 @@ class Project(AbstractModel):
             self.readme = self.ReadMe(self)
         return self.readme
 
+    def update_readme(self):
+        '''
+        Render README of current project state into cache.
+        '''
+        self.readme = self.ReadMe(self)
+
     @property
     def readme_content(self):
         return self.__get_readme().content
@@ -345,12 +407,57 @@ class Task(BModel):
 
 class ModulesQuerySet(BQuerySet):
     use_for_related_fields = True
+    docs_batch_size = 100
+
+    def _get_docs(self, chunk):
+        paths, namespace = chunk
+        return AnsibleModulesDocs(paths=paths).get_docs(namespace)
+
+    def load_docs(self, workers=4):
+        '''
+        Load and save docs of modules, which don't have them yet.
+        Docs are loaded by top-level namespaces (one `pm_ansible` call
+        for every namespace) in thread pool with `workers` size.
+        Docs are saved by batches of `docs_batch_size` modules.
+
+        :return: number of updated modules.
+        :rtype: int
+        '''
+        modules = list(self.filter(_data='{}').select_related('project'))
+        chunks = set((module.project, module.path.split('.')[0]) for module in modules)
+        chunks = [
+            (project.get_modules_paths() if project else None, namespace)
+            for project, namespace in chunks
+        ]
+        if not chunks:
+            return 0
+        pool = ThreadPool(max(min(workers, len(chunks)), 1))
+        try:
+            docs = dict()
+            for chunk_docs in pool.imap_unordered(self._get_docs, chunks):
+                docs.update(chunk_docs)
+        finally:
+            pool.close()
+            pool.join()
+        loaded = [(m.pk, docs[m.path]) for m in modules if m.path in docs]
+        updated = 0
+        with transaction.atomic():
+            for i in range(0, len(loaded), self.docs_batch_size):
+                batch = loaded[i:i + self.docs_batch_size]
+                updated += self.model.objects.filter(
+                    pk__in=[pk for pk, _ in batch], _data='{}'
+                ).update(_data=Case(
+                    *[When(pk=pk, then=Value(data)) for pk, data in batch],
+                    output_field=models.CharField()
+                ))
+        return updated
 
 
 class Module(BModel):
     objects = ModulesQuerySet.as_manager()
     path        = models.CharField(max_length=1024)
     _data       = models.CharField(max_length=4096, default='{}')
+    source_hash = models.CharField(max_length=40, default='', blank=True)
     project     = models.ForeignKey(Project,
                                     on_delete=models.CASCADE,
                                     related_query_name="modules",
@@ -372,8 +479,7 @@ class Module(BModel):
     def _get_module_data_from_cli(self):
         path = None
         if self.project:
-            path = self.project.config.get('DEFAULT_MODULE_PATH', [])
-            path = list(filter(lambda p: self.project.path in p, path))
+            path = self.project.get_modules_paths()
         modules = AnsibleModules(detailed=True, paths=path)
         module_list = modules.get(self.path)
         module = module_list[0] if module_list else None
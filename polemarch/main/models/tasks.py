@@ -257,9 +257,12 @@ class PeriodicTask(AbstractModel):
             index += 1
         return kwargs
 
-    def get_vars(self):
-        qs = self.variables.order_by("key")
-        return OrderedDict(qs.values_list('key', 'value'))
+    def validate_vars(self, variables):
+        cmd = "module" if self.kind == "MODULE" else "playbook"
+        AnsibleArgumentsReference().validate_args(cmd, variables)
+
+    def sort_variables(self, variables):
+        return sorted(variables, key=lambda v: v.key)
 
     def get_schedule(self):
         if self.type == "CRONTAB":
@@ -396,6 +399,8 @@ class History(BModel):
     class Meta:
         default_related_name = "history"
         ordering = ["-start_time"]
+        # Keyset pagination of history.
+        index_together = [('start_time', 'id')]
 
     @property
     def working(self):
@@ -543,3 +548,5 @@ class HistoryLines(BModel):
     class Meta:
         default_related_name = "raw_history_line"
         ordering = ['-line_gnumber', '-line_number']
+        # Keyset pagination of history lines.
+        index_together = [('history', 'line_gnumber', 'line_number')]
@@ -10,6 +10,7 @@ import six
 from django.utils import timezone
 from vstutils.utils import tmp_file, KVExchanger, raise_context
 from .hosts import Inventory
+from .hooks import Hook
 from ...main.utils import (
     CmdExecutor, CalledProcessError, AnsibleArgumentsReference, PMObject
 )
@@ -204,7 +205,8 @@ class AnsibleCommand(PMObject):
         ))
 
     def get_workdir(self):
-        return self.project.path
+        snapshot = getattr(self, 'snapshot', None)
+        return snapshot.path if snapshot else self.project.path
 
     @property
     def workdir(self):
@@ -232,6 +234,7 @@ class AnsibleCommand(PMObject):
         self.history = history if history else DummyHistory()
         self.history.status = "RUN"
         self.project.sync_on_execution_handler(self.history)
+        self.snapshot = self.project.pin_snapshot()
         if inventory:
             self.inventory_object = self.Inventory(inventory, cwd=self.workdir)
             self.history.raw_inventory = self.hide_passwords(
@@ -239,11 +242,13 @@ class AnsibleCommand(PMObject):
             )
         else:  # nocv
             self.inventory_object = None
-        self.history.revision = project.revision
+        self.history.revision = project.get_snapshot_revision(self.snapshot)
         self.history.save()
         self.executor = self.ExecutorClass(self.history)
 
     def _send_hook(self, when):
+        if not Hook.objects.has_hooks(when):
+            return
         msg = OrderedDict(execution_type=self.history.kind, when=when)
         inventory = self.history.inventory
         if isinstance(inventory, Inventory):
@@ -298,6 +303,8 @@ class AnsibleCommand(PMObject):
         finally:
             inventory_object = getattr(self, "inventory_object", None)
             inventory_object and inventory_object.close()
+            snapshot = getattr(self, "snapshot", None)
+            snapshot and self.project.release_snapshot(snapshot)
             self.history.stop_time = timezone.now()
             self.history.save()
             self._send_hook('after_execution')
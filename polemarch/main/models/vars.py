@@ -2,20 +2,25 @@
 from __future__ import unicode_literals
 
 import logging
+import json
 import uuid
 
 from functools import reduce
 from collections import OrderedDict
-from django.db import transaction
+from django.db import transaction, IntegrityError
 from django.db.models import Case, When, Value
+from django.dispatch import Signal
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from vstutils.utils import tmp_file
-from .base import ACLModel, BQuerySet, BModel, models
+from .base import ACLModel, BQuerySet, BModel, Manager, models
 
 
 logger = logging.getLogger("polemarch")
 
+# Sent once after all variables of object were replaced by `set_vars`.
+vars_updated = Signal(providing_args=['instance', 'variables'])
+
 
 def update_boolean(items, item):
     value = items.get(item, None)
@@ -45,15 +50,92 @@ class VariablesQuerySet(BQuerySet):
     def cleared(self):
         return super(VariablesQuerySet, self).cleared().sort_by_key()
 
+    def _upsert(self, **kwargs):
+        value = kwargs.pop('value', None)
+        owner = kwargs.pop('content_object', None) or self._hints.get('instance', None)
+        create_kwargs = dict(kwargs, value=value)
+        if isinstance(owner, AbstractModel):
+            # Variable is bound to owner object, so owner receives
+            # updated variables snapshot.
+            kwargs['content_type'] = ContentType.objects.get_for_model(owner)
+            kwargs['object_id'] = owner.pk
+            create_kwargs = dict(kwargs, value=value, content_object=owner)
+            create_kwargs.pop('content_type')
+            create_kwargs.pop('object_id')
+        with transaction.atomic(using=self.db):
+            variable = self.select_for_update().filter(**kwargs).first()
+            if variable is None:
+                try:
+                    with transaction.atomic(using=self.db):
+                        variable = super(VariablesQuerySet, self).create(**create_kwargs)
+                        return variable, True
+                except IntegrityError:
+                    # Variable was created by concurrent request.
+                    variable = self.select_for_update().get(**kwargs)
+            variable.value = value
+            if isinstance(owner, AbstractModel):
+                variable.content_object = owner
+            variable.save(using=self.db)
+        return variable, False
+
+    def create(self, **kwargs):
+        '''
+        Create variable or update value of existing variable
+        with the same key of the same object.
+        '''
+        return self._upsert(**kwargs)[0]
+
+    def update_or_create(self, defaults=None, **kwargs):
+        kwargs.update(defaults or {})
+        return self._upsert(**kwargs)
+
+    def update(self, **kwargs):
+        '''
+        Bulk update of variables, which sends no signals, so snapshots
+        of owners are reset to be rebuilt on next read.
+        '''
+        owners = dict()
+        for content_type_id, object_id in self.order_by().values_list(
+                'content_type', 'object_id').distinct():
+            owners.setdefault(content_type_id, []).append(object_id)
+        with transaction.atomic(using=self.db):
+            result = super(VariablesQuerySet, self).update(**kwargs)
+            for content_type_id, objects_ids in owners.items():
+                model = ContentType.objects.get_for_id(content_type_id).model_class()
+                if model is not None and issubclass(model, AbstractModel):
+                    model._base_manager.using(self.db).filter(pk__in=objects_ids).update(
+                        vars_snapshot=None
+                    )
+        instance = self._hints.get('instance', None)
+        if isinstance(instance, AbstractModel):
+            instance.vars_snapshot = None
+        return result
+
+
+class VariablesManager(Manager.from_queryset(VariablesQuerySet)):
+    use_for_related_fields = True
+
+    def get_queryset(self):
+        queryset = super(VariablesManager, self).get_queryset()
+        # Related manager of object (`obj.variables`) passes object to queryset.
+        instance = getattr(self, 'instance', None)
+        if instance is not None:
+            queryset._add_hints(instance=instance)
+        return queryset
+
 
 class Variable(BModel):
-    objects = VariablesQuerySet.as_manager()
+    objects = VariablesManager()
     content_type   = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id      = models.PositiveIntegerField()
     content_object = GenericForeignKey('content_type', 'object_id')
     key            = models.CharField(max_length=512)
     value          = models.CharField(max_length=2*1024, null=True)
 
+    class Meta:
+        unique_together = [('content_type', 'object_id', 'key')]
+        index_together = [('content_type', 'key')]
+
     variables_keys = [
         "ansible_host",
         'ansible_port',
@@ -86,6 +168,17 @@ class Variable(BModel):
     def __unicode__(self):  # pragma: no cover
         return "{}={}".format(self.key, self.value)
 
+    @classmethod
+    def get_sort_index(cls, variable):
+        '''
+        Same ordering as `VariablesQuerySet.sort_by_key` for variables
+        which are already fetched (e.g. by `prefetch_related`).
+        '''
+        key = variable.key
+        if key in cls.variables_keys:
+            return cls.variables_keys.index(key), key
+        return (99 if key.startswith("ansible_") else 100), key
+
 
 class AbstractVarsQuerySet(BQuerySet):
     use_for_related_fields = True
@@ -102,6 +195,9 @@ class AbstractModel(ACLModel):
     name        = models.CharField(max_length=512, default=uuid.uuid1)
     variables   = GenericRelation(Variable, related_query_name="variables",
                                   object_id_field="object_id")
+    # Ordered JSON copy of `variables` for reading without joins.
+    # `Variable` rows are source of truth, NULL means not built yet.
+    vars_snapshot = models.TextField(null=True, default='{}', editable=False)
 
     class Meta:
         abstract = True
@@ -123,18 +219,94 @@ class AbstractModel(ACLModel):
         # pylint: disable=unused-argument
         return OrderedDict(id=self.id, name=self.name)
 
+    def save(self, *args, **kwargs):
+        # pylint: disable=arguments-differ
+        # Snapshot is written only by `update_vars_snapshot`, so stale object
+        # doesn't overwrite snapshot of concurrent variables change.
+        is_update = self.pk is not None and not (
+            self._state.adding or kwargs.get('force_insert', False)
+        )
+        if is_update and kwargs.get('update_fields', None) is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'vars_snapshot' and
+                field.attname not in deferred
+            ]
+        return super(AbstractModel, self).save(*args, **kwargs)
+
+    def validate_vars(self, variables):
+        '''
+        Validate variables before save.
+
+        :param variables: -- dict with variables which will be saved.
+        :raises django.core.validators.ValidationError: if any variable is invalid.
+        '''
+
     @transaction.atomic()
     def set_vars(self, variables):
+        '''
+        Replace all variables of object by one bulk insert.
+        Variables are validated once and `vars_updated` signal is sent
+        instead of signals for every variable.
+        '''
         encr = "[~~ENCRYPTED~~]"
-        encrypted_vars = {k: v for k, v in variables.items() if v == encr}
-        other_vars = {k: v for k, v in variables.items() if v != encr}
-        self.variables.exclude(key__in=encrypted_vars.keys()).delete()
-        for key, value in other_vars.items():
-            self.variables.create(key=key, value=value)
+        encrypted_vars = [k for k, v in variables.items() if v == encr]
+        other_vars = OrderedDict((k, v) for k, v in variables.items() if v != encr)
+        self.validate_vars(other_vars)
+        # Prefetched variables are outdated after update.
+        getattr(self, '_prefetched_objects_cache', {}).pop('variables', None)
+        existed = self.variables.exclude(key__in=encrypted_vars)
+        existed._raw_delete(existed.db)
+        Variable.objects.bulk_create([
+            Variable(key=key, value=value, content_object=self)
+            for key, value in other_vars.items()
+        ])
+        self.update_vars_snapshot()
+        vars_updated.send(sender=self.__class__, instance=self, variables=other_vars)
+
+    def get_variables(self):
+        '''
+        All variables of object. Uses prefetched variables if exist,
+        so `prefetch_related('variables')` avoids query per object.
+        '''
+        return list(self.variables.all())
+
+    def sort_variables(self, variables):
+        return sorted(variables, key=Variable.get_sort_index)
+
+    def build_vars_snapshot(self):
+        '''
+        Ordered variables of object built from `Variable` rows.
+        '''
+        variables = self.sort_variables(self.get_variables())
+        return OrderedDict((v.key, v.value) for v in variables)
+
+    def update_vars_snapshot(self):
+        '''
+        Rebuild and save variables snapshot from `Variable` rows.
+        Called in transaction of every variables change.
+        Row of object is locked, so concurrent changes rebuild
+        snapshot one by one and the last one sees all variables.
+        '''
+        getattr(self, '_prefetched_objects_cache', {}).pop('variables', None)
+        queryset = self.__class__._base_manager.filter(pk=self.pk)
+        with transaction.atomic(savepoint=False):
+            list(queryset.select_for_update().values_list('pk', flat=True))
+            variables = self.build_vars_snapshot()
+            self.vars_snapshot = json.dumps(variables)
+            queryset.update(vars_snapshot=self.vars_snapshot)
+        return variables
+
+    def get_vars_snapshot(self):
+        if self.vars_snapshot is not None:
+            return json.loads(self.vars_snapshot, object_pairs_hook=OrderedDict)
+        if self.pk is None:  # nocv
+            return self.build_vars_snapshot()
+        return self.update_vars_snapshot()
 
     def get_vars(self):
-        qs = self.variables.all().sort_by_key().values_list('key', 'value')
-        return reduce(update_boolean, self.BOOLEAN_VARS, OrderedDict(qs))
+        return reduce(update_boolean, self.BOOLEAN_VARS, self.get_vars_snapshot())
 
     def get_generated_vars(self):
         files = []
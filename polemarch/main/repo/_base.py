@@ -3,14 +3,26 @@ from __future__ import unicode_literals
 
 import os
 import re
+import json
+import errno
+import time
+import uuid
+import fcntl
+import sys
 import shutil
+import hashlib
 import logging
 import traceback
 
-from six.moves.urllib.request import urlretrieve
+from contextlib import contextmanager
+import six
+import requests
+from six.moves.urllib.parse import urlparse
+from six.moves.urllib.request import urlopen
 from django.db import transaction
 from vstutils.utils import raise_context
 from ..utils import AnsibleModules
+from .snapshots import Snapshots
 
 logger = logging.getLogger("polemarch")
 
@@ -19,6 +31,11 @@ class _Base(object):
     __slots__ = 'options', 'proj', 'path'
 
     regex = r"(^[\w\d\.\-_]{1,})\.yml"
+    # Names of `recover_<stage>` operations, which are tried before reclone.
+    recovery_stages = ()
+    # Sync replaces project files instead of rewriting them in place,
+    # so snapshots could be made of hardlinks.
+    snapshot_hardlinks = True
 
     def __init__(self, project, **options):
         self.options = options
@@ -28,6 +45,106 @@ class _Base(object):
     def _set_status(self, status):
         self.proj.set_status(status)
 
+    def _get_sync_marker(self):
+        return '{}/.sync/{}'.format(os.path.dirname(self.path.rstrip('/')), self.proj.id)
+
+    def _mark_synced(self, revision=None):
+        marker = self._get_sync_marker()
+        if not os.path.isdir(os.path.dirname(marker)):
+            os.makedirs(os.path.dirname(marker))
+        with open(marker, 'w') as fd:
+            fd.write(revision or '')
+
+    def _get_synced_revision(self):
+        with raise_context():
+            with open(self._get_sync_marker(), 'r') as fd:
+                return fd.read().strip() or None
+
+    def get_last_sync_time(self):
+        '''
+        Time of last successful sync on this node.
+
+        :return: timestamp or 0 if project has never been synced.
+        :rtype: float
+        '''
+        try:
+            return os.path.getmtime(self._get_sync_marker())
+        except OSError:
+            return 0
+
+    @contextmanager
+    def sync_lock(self, shared=False, wait=True):
+        '''
+        Exclusive lock for operations with project directory on this node.
+        Shared lock is taken by readers of project files.
+        Released automatically if worker process dies.
+
+        :param shared: -- take shared lock instead of exclusive.
+        :param wait: -- wait for lock, otherwise `False` is yielded if lock is busy.
+        :return: -- True if lock is taken.
+        '''
+        lock_file = self._get_sync_marker() + '.lock'
+        if not os.path.isdir(os.path.dirname(lock_file)):
+            with raise_context():
+                os.makedirs(os.path.dirname(lock_file))
+        with open(lock_file, 'a') as fd:
+            operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            try:
+                fcntl.flock(fd, operation if wait else operation | fcntl.LOCK_NB)
+            except (IOError, OSError) as err:
+                if wait or err.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def sync_on_run(self, timeout=0):
+        '''
+        Sync project before execution. Concurrent executions wait
+        for one in-flight sync instead of starting their own,
+        and sync is skipped if project was synced less than `timeout` seconds ago.
+
+        :param timeout: project freshness time in seconds.
+        :type timeout: int
+        :return: sync result or None if sync was skipped.
+        '''
+        started = time.time()
+        with self.sync_lock():
+            if self.get_last_sync_time() >= started - timeout:
+                self.message('Project is fresh, skip sync on run.')
+                return None
+            return self.get()
+
+    @property
+    def snapshots(self):
+        return Snapshots(self)
+
+    def get_snapshot_key(self):
+        '''
+        Snapshot name of project files state. Local revision is used if
+        project has it, otherwise fingerprint of project files.
+
+        :return: revision or hex digest of files paths, sizes and modification times.
+        :rtype: str
+        '''
+        revision = self.get_local_revision()
+        if revision:
+            return revision
+        digest = hashlib.sha1()
+        exclude = Snapshots.exclude
+        for root, dirs, files in os.walk(self.path):
+            dirs[:] = sorted(d for d in dirs if d not in exclude)
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                stat = os.lstat(path)
+                digest.update('{}:{}:{}\n'.format(
+                    os.path.relpath(path, self.path), stat.st_size, stat.st_mtime
+                ).encode('utf-8'))
+        return digest.hexdigest()
+
     @raise_context()
     def _load_yaml(self):
         '''
@@ -128,49 +245,73 @@ class _Base(object):
     def _set_tasks_list(self, playbooks_names):
         """
         Updates playbooks in project.
+        Only new playbooks are created and only missing are removed,
+        so existing playbooks keep their ids.
 
         :rtype: None
         """
         # pylint: disable=invalid-name
         project = self.proj
-        project.playbook.all().delete()
         PlaybookModel = self.proj.playbook.model
         hidden = project.hidden
         split = str.split
-        playbook_objects = (
-            PlaybookModel(
-                name=split(str(p), ".yml")[0], playbook=p,
-                hidden=hidden, project=project
-            ) for p in playbooks_names
-        )
-        PlaybookModel.objects.bulk_create(playbook_objects) if playbook_objects else None
+        playbooks_names = set(map(str, playbooks_names))
+        with transaction.atomic():
+            existed = dict(project.playbook.values_list('playbook', 'hidden'))
+            project.playbook.filter(
+                playbook__in=set(existed.keys()) - playbooks_names
+            ).delete()
+            changed = [p for p in playbooks_names if existed.get(p, hidden) != hidden]
+            project.playbook.filter(playbook__in=changed).update(hidden=hidden)
+            PlaybookModel.objects.bulk_create([
+                PlaybookModel(
+                    name=split(p, ".yml")[0], playbook=p,
+                    hidden=hidden, project=project
+                ) for p in sorted(playbooks_names - set(existed.keys()))
+            ])
 
     def __get_project_modules(self, module_path):
         valid_paths = tuple(filter(self._dir_exists, module_path))
         if not valid_paths:
-            return []
+            return {}
         modules = AnsibleModules(detailed=False, paths=valid_paths)
         modules.clear_cache()
-        modules_list = modules.all()
-        modules_list.sort()
-        return modules_list
+        return {path: modules.get_source_hash(path) for path in modules.all()}
+
+    @raise_context()
+    def _find_project_modules(self):
+        '''
+        Find modules in project modules paths.
+
+        :return: dict of modules with source hashes or None if search failed.
+        '''
+        return self.__get_project_modules(self.proj.get_modules_paths())
 
     @raise_context()
-    def _set_project_modules(self):
+    def _set_project_modules(self, modules):
         '''
-        Update project modules
+        Update project modules. Cached docs are dropped only
+        for modules which source was changed.
+
+        :param modules: dict of found modules with source hashes.
         '''
         # pylint: disable=invalid-name
+        if modules is None:
+            return
         project = self.proj
-        project.get_ansible_config_parser().clear_cache()
-        project.modules.all().delete()
         ModuleClass = self.proj.modules.model
-        paths = project.config.get('DEFAULT_MODULE_PATH', [])
-        paths = filter(lambda mp: project.path in mp, paths)
-        modules = self.__get_project_modules(paths)
-        ModuleClass.objects.bulk_create([
-            ModuleClass(path=path, project=project) for path in modules
-        ])
+        with transaction.atomic():
+            existed = dict(project.modules.values_list('path', 'source_hash'))
+            project.modules.filter(path__in=set(existed.keys()) - set(modules)).delete()
+            for path, source_hash in modules.items():
+                if path in existed and existed[path] != source_hash:
+                    project.modules.filter(path=path).update(
+                        _data='{}', source_hash=source_hash
+                    )
+            ModuleClass.objects.bulk_create([
+                ModuleClass(path=path, project=project, source_hash=modules[path])
+                for path in sorted(set(modules) - set(existed.keys()))
+            ])
 
     def _update_tasks(self, files):
         '''
@@ -200,25 +341,47 @@ class _Base(object):
     def _make_operations(self, operation):
         '''
         Handle VCS operations and sync data from project.
+        Network and filesystem operations are made without
+        database transaction, so only short update of project
+        data is made in transaction.
 
         :param operation: function that should be hdandled.
-        :return: tuple with repo-object and fetch-results
+        :return: tuple with repo-object, fetch-results and
+                 flag that playbooks, modules and templates were reindexed.
         '''
         self._set_status("SYNC")
         try:
+            result = self._operate(operation)
+            revision = self.get_local_revision()
+            reindex = revision is None or revision != self._get_synced_revision()
+            if reindex:
+                files = self._get_files(result[0])
+                modules = self._find_project_modules()
+                yaml_data = self._load_yaml() or dict()
+            else:
+                self.message('Revision {} is not changed, skip reindex.'.format(revision))
             with transaction.atomic():
-                result = self._operate(operation)
                 self._set_status("OK")
-                self._update_tasks(self._get_files(result[0]))
-                self._set_project_modules()
-                self._handle_yaml(self._load_yaml() or dict())
+                if reindex:
+                    self._update_tasks(files)
+                    self._set_project_modules(modules)
+                    self._handle_yaml(yaml_data)
+            if self.snapshots.enabled:
+                with raise_context():
+                    self.snapshots.update()
+            with raise_context():
+                self.proj.update_readme()
+            if reindex:
+                with raise_context():
+                    self.proj.start_modules_docs_task()
         except Exception as err:
             logger.debug(traceback.format_exc())
             self.message('Sync error: {}'.format(err), 'error')
             self._set_status("ERROR")
             raise
         else:
-            return result
+            self._mark_synced(revision)
+            return tuple(result) + (reindex,)
 
     def make_clone(self, options):  # pragma: no cover
         '''
@@ -240,6 +403,22 @@ class _Base(object):
         # pylint: disable=unused-argument
         return "NO VCS"
 
+    def get_local_revision(self):
+        '''
+        Revision of project files in project directory.
+
+        :return: revision or None if project files could not be versioned.
+        '''
+
+    def get_snapshot_revision(self, key):
+        '''
+        Revision of project files in snapshot.
+
+        :param key: -- key of snapshot.
+        '''
+        # pylint: disable=unused-argument
+        return self.revision()
+
     def get_branch_name(self):
         return "NO VCS"
 
@@ -249,6 +428,8 @@ class _Base(object):
 
         :return: user message
         '''
+        with raise_context():
+            os.remove(self._get_sync_marker())
         if os.path.exists(self.path):
             if os.path.isfile(self.path):
                 os.remove(self.path)  # nocv
@@ -268,15 +449,60 @@ class _Base(object):
                 self.delete()
         raise Exception("Clone didn't perform by {} attempts.".format(attempt))
 
+    def _recover(self):
+        '''
+        Try to repair existing project data after failed update
+        with recovery stages of repo backend.
+
+        :return: result of sync with name of succeeded stage or None.
+        '''
+        for stage in self.recovery_stages:
+            self.message(
+                'Trying to recover project by "{}" stage.'.format(stage), 'warning'
+            )
+            with raise_context():
+                result = self._make_operations(getattr(self, 'recover_{}'.format(stage)))
+                self.message('Project recovered by "{}" stage.'.format(stage), 'warning')
+                return tuple(result) + (stage,)
+        return None
+
+    def is_remote_available(self, options):
+        '''
+        Check that remote of project could be reached.
+
+        :return: False if remote is unreachable or access is denied.
+        :rtype: bool
+        '''
+        # pylint: disable=unused-argument
+        return True
+
     def get(self):
+        '''
+        Update project. Failed update is repaired with recovery stages
+        and project is recloned only if all of them failed.
+        Errors of unreachable remote are raised as is, because
+        local project data is not corrupted by them.
+
+        :return: tuple with sync results and name of recovery stage,
+                 which is None if update was succeeded at first time.
+        '''
         # pylint: disable=broad-except
-        attempt = 2
-        for __ in range(attempt):
-            try:
-                return self._make_operations(self.make_update)
-            except:
-                self.delete()
-        raise Exception("Upd didn't perform by {} attempts.".format(attempt))
+        try:
+            return tuple(self._make_operations(self.make_update)) + (None,)
+        except:
+            exc_info = sys.exc_info()
+            if not self._operate(self.is_remote_available):
+                six.reraise(*exc_info)
+            result = self._recover()
+            if result is not None:
+                return result
+        self.message('Recovery failed, project will be recloned.', 'warning')
+        self.delete()
+        try:
+            return tuple(self._make_operations(self.make_update)) + ('reclone',)
+        except:
+            self.delete()
+        raise Exception("Upd didn't perform after recovery and reclone.")
 
     def check(self):
         pass  # nocv
@@ -285,23 +511,149 @@ class _Base(object):
         return self._operate(self.get_revision)
 
 
+class _ArchiveStream(object):
+    '''
+    Readable archive stream, which calculates digest of read content.
+    '''
+    __slots__ = 'stream', 'hash', 'etag', 'last_modified'
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, stream, etag=None, last_modified=None):
+        self.stream = stream
+        self.hash = hashlib.sha256()
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.hash.update(data)
+        return data
+
+    def drain(self):
+        while self.read(self.chunk_size):
+            pass
+
+    @property
+    def digest(self):
+        return self.hash.hexdigest()
+
+    def close(self):
+        self.stream.close()
+
+
 class _ArchiveRepo(_Base):
+    '''
+    Base class for repos from archives by url.
+    Archive is downloaded with conditional request and extracted
+    from response stream. Project files are replaced only if
+    digest of archive differs from digest of last extracted archive.
+    '''
+    download_timeout = 60
+
     def make_clone(self, options):
         if os.path.exists(self.path):
             shutil.rmtree(self.path)
-        os.mkdir(self.path)
-        archive = self._download(self.proj.repository, options)
-        self._extract(archive, self.path, options)
+        self._update_from_archive(options)
         return None, None
 
     def make_update(self, options):
-        archive = self._download(self.proj.repository, options)
-        self._extract(archive, self.path, options)
+        self._update_from_archive(options)
         return None, None
 
+    def _get_archive_state_file(self):
+        return self._get_sync_marker() + '.archive'
+
+    def _get_archive_state(self):
+        with raise_context():
+            with open(self._get_archive_state_file(), 'r') as fd:
+                return json.load(fd)
+        return dict()
+
+    def _set_archive_state(self, **state):
+        state_file = self._get_archive_state_file()
+        if not os.path.isdir(os.path.dirname(state_file)):
+            os.makedirs(os.path.dirname(state_file))
+        with open(state_file, 'w') as fd:
+            json.dump(state, fd)
+
+    def _replace_tree(self, new_path):
+        # pylint: disable=bare-except
+        backup_path = '{}.{}.bak'.format(self.path, uuid.uuid4().hex)
+        moved = False
+        if os.path.exists(self.path):
+            os.rename(self.path, backup_path)
+            moved = True
+        try:
+            os.rename(new_path, self.path)
+        except:
+            os.rename(backup_path, self.path) if moved else None
+            raise
+        shutil.rmtree(backup_path) if moved else None
+
+    def _update_from_archive(self, options):
+        url = self.proj.repository
+        archive = self._download(url, options)
+        if archive is None:
+            self.message('Archive is not modified, skip extraction.')
+            return
+        if isinstance(archive, six.string_types):
+            archive = _ArchiveStream(open(archive, 'rb'))
+        new_path = '{}.{}.new'.format(self.path, uuid.uuid4().hex)
+        try:
+            self._extract(archive, new_path, options)
+            archive.drain()
+            state = self._get_archive_state()
+            if os.path.isdir(self.path) and state.get('digest', None) == archive.digest:
+                self.message('Archive content is not changed, skip extraction.')
+            else:
+                self._replace_tree(new_path)
+            self._set_archive_state(
+                url=url, digest=archive.digest,
+                etag=archive.etag, last_modified=archive.last_modified
+            )
+        finally:
+            archive.close()
+            shutil.rmtree(new_path, ignore_errors=True)
+
     def _download(self, url, options):
+        '''
+        Request archive by url.
+
+        :return: archive stream or None if archive is not modified.
+        :rtype: _ArchiveStream, None
+        '''
         # pylint: disable=unused-argument
-        return urlretrieve(url)[0]  # nocv
+        timeout = self.options.get('DOWNLOAD_TIMEOUT', self.download_timeout)
+        if urlparse(url).scheme not in ('http', 'https'):
+            # Other schemes (file, ftp) don't support conditional requests.
+            return _ArchiveStream(urlopen(url, timeout=timeout))
+        headers = dict()
+        state = self._get_archive_state()
+        if state.get('url', None) == url and os.path.isdir(self.path):
+            if state.get('etag', None):
+                headers['If-None-Match'] = state['etag']
+            if state.get('last_modified', None):
+                headers['If-Modified-Since'] = state['last_modified']
+        response = requests.get(url, headers=headers, stream=True, timeout=timeout)
+        if response.status_code == 304:
+            response.close()
+            return None
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return _ArchiveStream(
+            response.raw,
+            etag=response.headers.get('ETag', None),
+            last_modified=response.headers.get('Last-Modified', None)
+        )
 
     def _extract(self, archive, path, options):
         raise NotImplementedError  # nocv
+
+    def get_local_revision(self):
+        return self._get_archive_state().get('digest', None)
+
+    def delete(self):
+        with raise_context():
+            os.remove(self._get_archive_state_file())
+        return super(_ArchiveRepo, self).delete()
@@ -4,6 +4,9 @@ from ._base import _Base, os
 
 
 class Manual(_Base):
+    # Files of manual projects are edited in place.
+    snapshot_hardlinks = False
+
     def make_clone(self, options):
         try:
             os.mkdir(self.path)
@@ -0,0 +1,129 @@
+from __future__ import unicode_literals
+
+import os
+import re
+import time
+import fcntl
+import shutil
+import hashlib
+import logging
+from contextlib import contextmanager
+from django.conf import settings
+from vstutils.utils import raise_context
+try:
+    import git
+except:  # nocv
+    pass
+
+logger = logging.getLogger("polemarch")
+
+
+class GitMirror(object):
+    '''
+    Bare mirror of git remote, which is shared by projects with same remote
+    and same credentials.
+
+    Mirror lives in ``<projects_dir>/.mirrors/<hash of normalized url>.git``,
+    hash of credentials is added to the name of mirror of private remote.
+    Projects are cloned with ``--reference`` to mirror, so objects are stored
+    once, and fetch from mirror instead of remote.
+    Mirror is fetched under lock, and processes which waited for lock
+    while mirror was fetched don't fetch it again.
+    '''
+    __slots__ = 'url', 'path'
+
+    url_regex = re.compile(
+        r'^(?P<scheme>[\w\+\.\-]+)://'
+        r'(?:(?P<userinfo>[^@/]*)@)?(?P<host>[^/]*)(?P<path>.*)$'
+    )
+    scp_regex = re.compile(r'^(?:(?P<userinfo>[^@/:]*)@)?(?P<path>.*)$')
+
+    def __init__(self, url, projects_dir, credentials=''):
+        self.url = url
+        key = hashlib.sha1(self.normalize_url(url).encode('utf-8')).hexdigest()
+        credentials = '\n'.join(filter(bool, (self.get_userinfo(url), credentials)))
+        if credentials:
+            key += '-' + hashlib.sha1(credentials.encode('utf-8')).hexdigest()
+        self.path = '{}/.mirrors/{}.git'.format(projects_dir.rstrip('/'), key)
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'PROJECTS_GIT_MIRRORS', False)
+
+    @classmethod
+    def get_userinfo(cls, url):
+        url = url.strip()
+        match = cls.url_regex.match(url) or cls.scp_regex.match(url)
+        return match.group('userinfo')
+
+    @classmethod
+    def normalize_url(cls, url):
+        '''
+        Make same key for different spellings of one remote:
+        strip credentials, case of scheme and host, trailing slashes
+        and `.git` suffix.
+        '''
+        url = url.strip()
+        match = cls.url_regex.match(url)
+        if match:
+            url = '{}://{}{}'.format(
+                match.group('scheme').lower(),
+                match.group('host').lower(),
+                match.group('path')
+            )
+        else:
+            # scp-like syntax: user@host:path
+            url = cls.scp_regex.match(url).group('path')
+        url = url.rstrip('/')
+        return url[:-4] if url.endswith('.git') else url
+
+    def _get_fetch_stamp(self):
+        return self.path + '.fetched'
+
+    def get_last_fetch_time(self):
+        try:
+            return os.path.getmtime(self._get_fetch_stamp())
+        except OSError:
+            return 0
+
+    @contextmanager
+    def _lock(self):
+        lock_file = self.path + '.lock'
+        if not os.path.isdir(os.path.dirname(lock_file)):
+            with raise_context():
+                os.makedirs(os.path.dirname(lock_file))
+        with open(lock_file, 'a') as fd:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _clone(self, env):
+        logger.debug('Create git mirror of [{}].'.format(self.url))
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        try:
+            repo = git.Repo.clone_from(self.url, tmp_path, env=env, mirror=True)
+            # Objects of mirror are used by projects, so they mustn't be pruned.
+            repo.git.config('gc.auto', '0')
+            os.rename(tmp_path, self.path)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def update(self, env):
+        '''
+        Create mirror or fetch it from remote.
+
+        :param env: environment variables for git.
+        '''
+        started = time.time()
+        with self._lock():
+            if self.get_last_fetch_time() >= started:
+                return
+            if not os.path.isdir(self.path):
+                self._clone(env)
+            else:
+                repo = git.Repo(self.path)
+                with repo.git.custom_environment(**env):
+                    repo.git.fetch('origin', prune=True)
+            open(self._get_fetch_stamp(), 'w').close()
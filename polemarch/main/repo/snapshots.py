@@ -0,0 +1,180 @@
+# pylint: disable=expression-not-assigned
+from __future__ import unicode_literals
+
+import os
+import uuid
+import shutil
+import logging
+from collections import namedtuple
+from django.conf import settings
+from vstutils.utils import Lock, raise_context
+
+logger = logging.getLogger("polemarch")
+SnapshotPin = namedtuple('SnapshotPin', 'path key token')
+
+
+class Snapshots(object):
+    '''
+    Immutable per-revision copies of project files.
+
+    Every snapshot lives in ``<projects_dir>/.snapshots/<project_id>/<key>``
+    and contains hardlinks to project files, so creating it is cheap.
+    Repo backends replace files on sync instead of rewriting them in place,
+    which keeps files in pinned snapshots untouched by concurrent syncs.
+    Files of backends without `snapshot_hardlinks` are copied.
+    Key is local revision of project, so snapshot is reused until it changes.
+    Executions pin snapshot at start and release it at the end.
+    Snapshots without pins are removed, except the current one.
+    '''
+    __slots__ = 'repo', 'root'
+
+    exclude = ('.git',)
+    lock_timeout = 60
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.root = '{}/.snapshots/{}'.format(
+            os.path.dirname(repo.path.rstrip('/')), repo.proj.id
+        )
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'PROJECTS_SNAPSHOTS', False)
+
+    def _lock(self):
+        return Lock(
+            'project-snapshots-{}'.format(self.repo.proj.id),
+            repeat=self.lock_timeout,
+            err_msg='Snapshots of project are locked by another operation.'
+        )
+
+    def get_path(self, key):
+        return '{}/{}'.format(self.root, key)
+
+    def _get_pins_path(self, key):
+        return '{}/.pins/{}'.format(self.root, key)
+
+    def _get_current_file(self):
+        return '{}/.current'.format(self.root)
+
+    def _get_current_key(self):
+        with raise_context():
+            with open(self._get_current_file(), 'r') as fd:
+                return fd.read().strip() or None
+
+    def _set_current_key(self, key):
+        tmp_name = '{}.{}'.format(self._get_current_file(), uuid.uuid4().hex)
+        with open(tmp_name, 'w') as fd:
+            fd.write(key)
+        os.rename(tmp_name, self._get_current_file())
+
+    def _link_file(self, src, dst):
+        if os.path.islink(src):
+            os.symlink(os.readlink(src), dst)
+            return
+        if not self.repo.snapshot_hardlinks:
+            shutil.copy2(src, dst)
+            return
+        try:
+            os.link(src, dst)
+        except OSError:  # nocv
+            # Cross-device or unsupported hardlinks.
+            shutil.copy2(src, dst)
+
+    def _link_tree(self, src, dst):
+        os.makedirs(dst)
+        for root, dirs, files in os.walk(src):
+            dirs[:] = [d for d in dirs if d not in self.exclude]
+            target_root = os.path.join(dst, os.path.relpath(root, src))
+            for name in dirs:
+                path = os.path.join(root, name)
+                if os.path.islink(path):
+                    self._link_file(path, os.path.join(target_root, name))
+                else:
+                    os.mkdir(os.path.join(target_root, name))
+            for name in files:
+                self._link_file(os.path.join(root, name), os.path.join(target_root, name))
+
+    def _create(self, key):
+        path = self.get_path(key)
+        if os.path.isdir(path):
+            return key
+        tmp_path = '{}/.tmp-{}'.format(self.root, uuid.uuid4().hex)
+        try:
+            self._link_tree(self.repo.path, tmp_path)
+            os.rename(tmp_path, path)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return key
+
+    def _is_pinned(self, key):
+        pins_path = self._get_pins_path(key)
+        return os.path.isdir(pins_path) and bool(os.listdir(pins_path))
+
+    def _collect(self, keep):
+        if not os.path.isdir(self.root):
+            return
+        for key in os.listdir(self.root):
+            if key.startswith('.') or key in keep or self._is_pinned(key):
+                continue
+            logger.debug('Remove snapshot [{}] of project [{}].'.format(
+                key, self.repo.proj.id
+            ))
+            shutil.rmtree(self.get_path(key), ignore_errors=True)
+            with raise_context():
+                os.rmdir(self._get_pins_path(key))
+
+    def update(self):
+        '''
+        Make snapshot of current project state and collect unused snapshots.
+        Called after successful sync.
+
+        :return: key of current snapshot.
+        :rtype: str
+        '''
+        with self._lock():
+            key = self._create(self.repo.get_snapshot_key())
+            self._set_current_key(key)
+            self._collect(keep=(key,))
+        return key
+
+    def _pin(self, key):
+        token = uuid.uuid4().hex
+        pins_path = self._get_pins_path(key)
+        os.makedirs(pins_path) if not os.path.isdir(pins_path) else None
+        open('{}/{}'.format(pins_path, token), 'w').close()
+        return SnapshotPin(self.get_path(key), key, token)
+
+    def pin(self):
+        '''
+        Pin snapshot for execution. While sync holds project directory,
+        last synced snapshot is pinned, otherwise snapshot of current
+        project state is created if it doesn't exist.
+        Snapshot is created under shared sync lock, so files are
+        never changed by sync during creation.
+
+        :rtype: SnapshotPin
+        '''
+        with self.repo.sync_lock(shared=True, wait=False) as locked:
+            if not locked:
+                with self._lock():
+                    key = self._get_current_key()
+                    if key and os.path.isdir(self.get_path(key)):
+                        return self._pin(key)
+        with self.repo.sync_lock(shared=True):
+            with self._lock():
+                return self._pin(self._create(self.repo.get_snapshot_key()))
+
+    def release(self, pin):
+        '''
+        Release pinned snapshot and collect unused snapshots.
+
+        :type pin: SnapshotPin
+        '''
+        with raise_context():
+            os.remove('{}/{}'.format(self._get_pins_path(pin.key), pin.token))
+        with self._lock():
+            self._collect(keep=(self._get_current_key(),))
+
+    def delete(self):
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -7,6 +7,7 @@ try:
 except:  # nocv
     warnings.warn("Git is not installed or have problems.")
 from ._base import _Base, os
+from .mirrors import GitMirror
 
 
 class _VCS(_Base):  # nocv
@@ -23,6 +24,11 @@ class _VCS(_Base):  # nocv
 class Git(_VCS):
     __slots__ = 'env', '_fetch_map'
 
+    recovery_stages = ('fetch', 'prune', 'reset', 'fsck')
+    _mirror_refspecs = (
+        '+refs/heads/*:refs/remotes/origin/*', '+refs/tags/*:refs/tags/*'
+    )
+
     _fetch_statuses = [
         "NEW_TAG", "NEW_HEAD", "HEAD_UPTODATE",
         "TAG_UPDATE", "REJECTED", "FORCED_UPDATE",
@@ -42,7 +48,9 @@ class Git(_VCS):
         self._fetch_map = {
             1 << x: self._fetch_statuses[x] for x in range(8)
         }
-        self.target_branch = self.proj.vars.get('repo_branch', None)
+        project_vars = self.proj.vars
+        self.target_branch = project_vars.get('repo_branch', None)
+        self.check_remote = project_vars.get('repo_sync_check_remote', False)
 
     def get_repo(self):
         return git.Repo(self.path)
@@ -50,8 +58,31 @@ class Git(_VCS):
     def vsc_clone(self, *args, **kwargs):
         return git.Repo.clone_from(*args, **kwargs)
 
-    @raise_context()
+    def get_mirror(self):
+        if not (GitMirror.enabled() and self.proj.repository):
+            return None
+        project_vars = self.proj.vars
+        credentials = '\n'.join(
+            '{}={}'.format(key, project_vars[key])
+            for key in ('repo_password', 'repo_key') if project_vars.get(key, None)
+        )
+        return GitMirror(
+            self.proj.repository, os.path.dirname(self.path.rstrip('/')), credentials
+        )
+
+    def _fetch_from_mirror(self, repo, mirror, env):
+        mirror.update(env)
+        kwargs = dict(self.options.get("FETCH_KWARGS", dict()), prune=True)
+        with repo.git.custom_environment(**env):
+            result = repo.git.fetch(mirror.path, *self._mirror_refspecs, **kwargs)
+            if not repo.head.is_detached:
+                result = repo.git.merge('@{upstream}')
+            return result
+
     def _fetch_from_remote(self, repo, env):
+        mirror = self.get_mirror()
+        if mirror is not None:
+            return self._fetch_from_mirror(repo, mirror, env)
         with repo.git.custom_environment(**env):
             kwargs = self.options.get("FETCH_KWARGS", dict())
             fetch_method = repo.git.fetch
@@ -63,6 +94,43 @@ class Git(_VCS):
         fetch_result = self._fetch_from_remote(repo, env)
         return fetch_result
 
+    def _get_remote_revision(self, repo, env):
+        '''
+        Get revision of target ref in remote repository without fetching.
+
+        :return: commit hexsha or None if ref was not found.
+        '''
+        if self.target_branch:
+            name = self.target_branch.replace('tags/', '')
+        elif not repo.head.is_detached:
+            name = repo.active_branch.name
+        else:  # nocv
+            return None
+        # Peeled annotated tag points to commit, so it is checked first.
+        refs = [
+            'refs/tags/{}^{{}}'.format(name),
+            'refs/tags/{}'.format(name),
+            'refs/heads/{}'.format(name),
+        ]
+        with repo.git.custom_environment(**env):
+            output = repo.git.ls_remote('origin', *refs)
+        remote_refs = {}
+        for line in output.splitlines():
+            if line.strip():
+                sha, ref = line.split('\t', 1)
+                remote_refs[ref.strip()] = sha.strip()
+        for ref in refs:
+            if ref in remote_refs:
+                return remote_refs[ref]
+        return None  # nocv
+
+    def _is_remote_changed(self, repo, env):
+        with raise_context():
+            if self._get_remote_revision(repo, env) == repo.head.object.hexsha:
+                self.message('Remote revision is not changed, skip fetch.')
+                return False
+        return True
+
     def get_branch_name(self):
         # pylint: disable=broad-except
         reponame = "waiting..."
@@ -78,6 +146,10 @@ class Git(_VCS):
         kw = dict(**self.options.get("CLONE_KWARGS", dict()))
         if self.target_branch:
             kw['branch'] = self.target_branch.replace('tags/', '')
+        mirror = self.get_mirror()
+        if mirror is not None:
+            mirror.update(env)
+            kw['reference'] = mirror.path
         repo = self.vsc_clone(self.proj.repository, self.path, env=env, **kw)
         with raise_context():
             self.proj.variables.update_or_create(
@@ -101,11 +173,65 @@ class Git(_VCS):
 
     def make_update(self, env):
         repo = self._get_or_create_repo(env)
+        if self.check_remote and not self._is_remote_changed(repo, env):
+            return repo, []
         resutls = repo, self.vcs_update(repo, env)
         with raise_context():
             repo.git.checkout(self.target_branch)
         return resutls
 
+    def _get_target_name(self, repo):
+        if self.target_branch:
+            return self.target_branch.replace('tags/', '')
+        return repo.active_branch.name
+
+    def recover_fetch(self, env):
+        return self.make_update(env)
+
+    def recover_prune(self, env):
+        repo = self.get_repo()
+        with repo.git.custom_environment(**env):
+            repo.git.fetch('origin', prune=True, tags=True)
+        return self.make_update(env)
+
+    def is_remote_available(self, env):
+        cmd = git.cmd.Git()
+        try:
+            with cmd.custom_environment(**env):
+                cmd.ls_remote(self.proj.repository, 'HEAD')
+        except git.GitCommandError:
+            self.message('Remote repository is not available.', 'warning')
+            return False
+        return True
+
+    def _reset_to_origin(self, repo):
+        name = self._get_target_name(repo)
+        if name in repo.tags:
+            ref = 'tags/{}'.format(name)
+            repo.git.checkout(ref, force=True)
+        else:
+            ref = 'origin/{}'.format(name)
+            repo.git.checkout('-B', name, ref, force=True)
+        repo.git.reset(ref, hard=True)
+
+    def recover_reset(self, env):
+        repo = self.get_repo()
+        # Reset to stale origin would discard local data for nothing.
+        with repo.git.custom_environment(**env):
+            repo.git.fetch('origin', prune=True, tags=True)
+        self._reset_to_origin(repo)
+        return repo, None
+
+    def recover_fsck(self, env):
+        repo = self.get_repo()
+        # Index is rebuilt from verified object store.
+        index_path = os.path.join(repo.git_dir, 'index')
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        repo.git.fsck(full=True)
+        self._reset_to_origin(repo)
+        return self.recover_prune(env)
+
     def get_revision(self, *args, **kwargs):
         # pylint: disable=unused-argument
         if self.proj.status == 'NEW':
@@ -113,6 +239,14 @@ class Git(_VCS):
         repo = self.get_repo()
         return repo.head.object.hexsha
 
+    @raise_context()
+    def get_local_revision(self):
+        return self.get_repo().head.object.hexsha
+
+    def get_snapshot_revision(self, key):
+        # Snapshots are named by commits.
+        return key
+
     def _with_password(self, tmp, env_vars):
         env_vars.update(self.env.get("PASSWORD", dict()))
         tmp.write("echo '{}'".format(self.proj.vars["repo_password"]))
@@ -144,8 +278,13 @@ class Git(_VCS):
         return dict(repo.index.entries.keys()).keys()
 
     def get(self):
-        return {res.ref.remote_head: self._fetch_map[res.flags]
-                for res in super(Git, self).get()[1]}
+        _, fetch_result, reindexed, recovery = super(Git, self).get()
+        if isinstance(fetch_result, (list, tuple)):
+            fetch_result = {
+                res.ref.remote_head: self._fetch_map[res.flags] for res in fetch_result
+            }
+        # Pull returns command output instead of fetch info.
+        return dict(fetch=fetch_result, reindexed=reindexed, recovery=recovery)
 
     def revision(self):
         try:
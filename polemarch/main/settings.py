@@ -7,6 +7,10 @@ APACHE = False if ("runserver" in sys.argv) else True
 # Directory for git projects
 PROJECTS_DIR = main.get("projects_dir", fallback="{LIB}/projects")
 os.makedirs(PROJECTS_DIR) if not os.path.exists(PROJECTS_DIR) else None
+# Run executions in immutable per-revision snapshots of projects
+PROJECTS_SNAPSHOTS = main.getboolean("projects_snapshots", fallback=False)
+# Share objects of git projects with same remote through local mirrors
+PROJECTS_GIT_MIRRORS = main.getboolean("projects_git_mirrors", fallback=False)
 
 # Polemarch apps
 INSTALLED_APPS += [
@@ -17,6 +21,7 @@ INSTALLED_APPS += [
 # Additional middleware and auth
 MIDDLEWARE_CLASSES += [
     'polemarch.main.middleware.PolemarchHeadersMiddleware',
+    'polemarch.main.middleware.HooksBatchMiddleware',
 ]
 
 AUTH_PASSWORD_VALIDATORS += [
@@ -230,6 +235,12 @@ TASKS_HANDLERS = {
     "PLAYBOOK": {
         "BACKEND": "polemarch.main.tasks.tasks.ExecuteAnsiblePlaybook"
     },
+    "MODULES_DOCS": {
+        "BACKEND": "polemarch.main.tasks.tasks.LoadModulesDocs"
+    },
+    "HOOKS": {
+        "BACKEND": "polemarch.main.tasks.tasks.DeliverHookEvent"
+    },
 }
 
 CLONE_RETRY = rpc.getint('clone_retry_count', fallback=5)
@@ -244,14 +255,43 @@ ACL = {
 # Outgoing hooks settings
 HOOKS = {
     "HTTP": {
-        "BACKEND": 'polemarch.main.hooks.http.Backend'
+        "BACKEND": 'polemarch.main.hooks.http.Backend',
+        "OPTIONS": {
+            "CONNECT_TIMEOUT": main.getint("hooks_http_connect_timeout", fallback=5),
+            "READ_TIMEOUT": main.getint("hooks_http_read_timeout", fallback=30),
+            # Recipients of one hook, which are sent simultaneously
+            "WORKERS": main.getint("hooks_http_workers", fallback=4),
+            "POOL_SIZE": main.getint("hooks_http_pool_size", fallback=10),
+        }
     },
     "SCRIPT": {
-        "BACKEND": 'polemarch.main.hooks.script.Backend'
+        "BACKEND": 'polemarch.main.hooks.script.Backend',
+        "OPTIONS": {
+            # Process group of script is killed after timeout
+            "TIMEOUT": main.getint("hooks_script_timeout", fallback=30),
+            "WORKERS": main.getint("hooks_script_workers", fallback=4),
+            "MAX_OUTPUT": main.getint("hooks_script_max_output", fallback=65536),
+        }
     },
 }
 
 HOOKS_DIR = main.get("hooks_dir", fallback="/etc/polemarch/hooks/")
+# Deliver hooks from outbox by background task with retries
+HOOKS_ASYNC = main.getboolean("hooks_async", fallback=False)
+HOOKS_RETRIES = main.getint("hooks_retry_count", fallback=5)
+HOOKS_RETRY_DELAY = main.getint("hooks_retry_delay", fallback=10)
+# Outbox events without delivery attempts during interval are restarted
+HOOKS_SWEEP_INTERVAL = main.getint("hooks_sweep_interval", fallback=600)
+if HOOKS_ASYNC:
+    CELERY_BEAT_SCHEDULE = {
+        'polemarch-sweep-hooks-events': {
+            'task': 'polemarch.main.tasks.tasks.SweepHookEvents',
+            'schedule': HOOKS_SWEEP_INTERVAL,
+        },
+    }
+# Send objects events of transaction as batched messages on commit
+HOOKS_COALESCE = main.getboolean("hooks_coalesce", fallback=False)
+HOOKS_BATCH_SIZE = main.getint("hooks_batch_size", fallback=100)
 
 __EXECUTOR_DEFAULT = '{INTERPRETER} -m pm_ansible'
 EXECUTOR = main.get("executor_path", fallback=__EXECUTOR_DEFAULT).strip().split(' ')
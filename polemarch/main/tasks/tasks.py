@@ -9,6 +9,7 @@ from ..models.utils import AnsibleModule, AnsiblePlaybook
 
 logger = logging.getLogger("polemarch")
 clone_retry = getattr(settings, 'CLONE_RETRY', 5)
+hooks_retry = getattr(settings, 'HOOKS_RETRIES', 5)
 
 
 @task(app, ignore_result=True, default_retry_delay=1, max_retries=clone_retry, bind=True)
@@ -36,6 +37,67 @@ class RepoTask(BaseTask):
             self.app.retry(exc=error)
 
 
+@task(app, ignore_result=True, bind=True)
+class LoadModulesDocs(BaseTask):
+    __slots__ = 'project_id', 'workers'
+
+    def __init__(self, app, project_id=None, workers=4, *args, **kwargs):
+        super(self.__class__, self).__init__(app, *args, **kwargs)
+        self.project_id, self.workers = project_id, workers
+
+    def run(self):
+        from ..models import Module
+        modules = Module.objects.filter(project_id=self.project_id)
+        updated = modules.load_docs(workers=self.workers)
+        logger.debug('Loaded docs of {} modules.'.format(updated))
+        return updated
+
+
+@task(app, ignore_result=True, bind=True, max_retries=hooks_retry)
+class DeliverHookEvent(BaseTask):
+    __slots__ = 'event_id',
+
+    class HookDeliveryError(TaskError):
+        _default_message = "Hooks delivery failed: {}."
+
+    def __init__(self, app, event_id, *args, **kwargs):
+        super(self.__class__, self).__init__(app, *args, **kwargs)
+        self.event_id = event_id
+
+    def run(self):
+        from ..models import HookEvent
+        # Event is delivered, dropped or delivered by other task.
+        event = HookEvent.objects.claim(self.event_id)
+        if event is None:
+            return
+        failed = event.deliver()
+        if not failed:
+            return
+        error = self.task_class.HookDeliveryError(
+            '; '.join(e for errors in failed.values() for e in errors)
+        )
+        retries = self.app.request.retries
+        if retries >= self.app.max_retries:
+            logger.error('Event {} is dropped after {} attempts. {}'.format(
+                event.when, event.attempts, error
+            ))
+            event.delete()
+            return
+        delay = getattr(settings, 'HOOKS_RETRY_DELAY', 10) * 2 ** retries
+        self.app.retry(exc=error, countdown=delay)
+
+
+@task(app, ignore_result=True, bind=True)
+class SweepHookEvents(BaseTask):
+    def run(self):
+        from ..models import HookEvent
+        interval = getattr(settings, 'HOOKS_SWEEP_INTERVAL', 600)
+        swept = HookEvent.objects.sweep(interval)
+        if swept:
+            logger.warning('Delivery of {} hooks events is restarted.'.format(swept))
+        return swept
+
+
 @task(app, ignore_result=True, bind=True)
 class ScheduledTask(BaseTask):
     __slots__ = 'job_id',
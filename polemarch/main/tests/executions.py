@@ -1195,7 +1195,7 @@ class ProjectTestCase(BaseExecutionsTestCase):
         response.reason = None
         response.text = "OK"
         ##
-        with self.patch('requests.post') as mock:
+        with self.patch('requests.Session.post') as mock:
             iterations = 2 * len(hook_urls)
             mock.side_effect = [response] * iterations
             # results = self.make_bulk(bulk_data, 'put')
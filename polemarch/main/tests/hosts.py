@@ -155,7 +155,7 @@ class InventoriesTestCase(InvBaseTestCase):
         self.generate_hooks(scripts)
         self.mass_create_bulk('hook', data)
         ##
-        with self.patch('subprocess.check_output') as mock:
+        with self.patch('polemarch.main.hooks.script.Backend.run_script') as mock:
             iterations = 3 * len(scripts)
             mock.side_effect = [''] * iterations
             results = self.make_bulk(bulk_data, 'put')
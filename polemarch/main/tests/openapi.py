@@ -1054,18 +1054,22 @@ class OApiTestCase(BaseTestCase):
         self.check_fields(objName, projectVariable['properties']['id'], **id_value)
 
         key_list = [
-            'repo_type', 'repo_sync_on_run', 'repo_branch',
-            'repo_password', 'repo_key'
+            'repo_type', 'repo_sync_on_run', 'repo_sync_on_run_timeout',
+            'repo_branch', 'repo_sync_check_remote', 'repo_password', 'repo_key'
         ]
         self.check_fields(objName, projectVariable['properties']['key'],
                           type='string', enum=key_list
                           )
         additional_properties = dict(
             field='key',
-            types=dict(repo_password='password', repo_key='secretfile'),
+            types=dict(
+                repo_password='password', repo_key='secretfile',
+                repo_sync_on_run_timeout='integer'
+            ),
             choices=dict(
                 repo_type=['MANUAL', 'GIT', 'TAR'],
-                repo_sync_on_run=[True, False]
+                repo_sync_on_run=[True, False],
+                repo_sync_check_remote=[True, False]
             )
         )
 
@@ -1828,7 +1832,9 @@ class OApiTestCase(BaseTestCase):
             dict(name='status', description=True, required=False, type='string'),
             dict(name='older', description=True, required=False, type='string'),
             dict(name='newer', description=True, required=False, type='string'),
-        ] + self.pm_filters + self.pm_name_filter + self.default_filters
+        ] + self.pm_filters + self.pm_name_filter + self.default_filters + [
+            dict(name='cursor', description=True, required=False, type='string'),
+        ]
         responses = dict(
             description=True,
             schema=dict(
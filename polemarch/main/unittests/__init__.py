@@ -1,6 +1,19 @@
 from .ansible import AnsibleTestCase
 from .utils import ExecutorTestCase, CMDExecutorTestCase, tmp_fileTestCase, ModelHandlerTestCase
-from .api import UsersTestCase
-from .hooks import HooksTestCase
+from .api import (
+    UsersTestCase, VariablesQueriesTestCase, ConditionalGetTestCase,
+    KeysetPaginationTestCase
+)
+from .hooks import (
+    HooksTestCase, HooksOutboxTestCase, HooksHTTPServerTestCase,
+    HooksCoalesceTestCase, HooksCacheTestCase, HooksScriptTestCase
+)
 from .tasks import TasksTestCase, TestTaskError, TestRepoTask
 from .models import ModelsTestCase
+from .repo import (
+    SnapshotsTestCase, IndexReconcileTestCase, ReadmeCacheTestCase,
+    SyncTransactionTestCase,
+    SyncProjectsCommandTestCase,
+    SyncOnRunTestCase, GitReindexTestCase, GitSnapshotsTestCase, GitMirrorTestCase,
+    TarDownloadTestCase
+)
@@ -1,7 +1,15 @@
+import os
+import shutil
+import tempfile
 import six
+try:
+    from mock import patch
+except ImportError:  # nocv
+    from unittest.mock import patch
 from django.test import TestCase
 from django.core.management import call_command
-from ..utils import AnsibleInventoryParser
+from ..utils import AnsibleInventoryParser, AnsibleConfigParser
+from ..models import Module
 
 inventory_data = '''
 test-host-single ansible_host=10.10.10.10
@@ -74,10 +82,70 @@ class AnsibleTestCase(TestCase):
     def test_modules(self):
         out = six.StringIO()
         call_command('update_ansible_modules', interactive=False, stdout=out)
-        self.assertEqual(
-            'The modules have been successfully updated.\n',
-            out.getvalue().replace('\x1b[32;1m', '').replace('\x1b[0m', '')
+        output = out.getvalue().replace('\x1b[32;1m', '').replace('\x1b[0m', '')
+        self.assertTrue(
+            output.startswith('The modules have been successfully updated.\n')
         )
+        self.assertIn('Added: ', output)
+        # Incremental update keeps modules and docs of unchanged modules
+        ping = Module.objects.get(path='system.ping', project=None)
+        ping_data = ping.data
+        Module.objects.filter(path='commands.shell').update(source_hash='old', _data='{}')
+        Module.objects.filter(path='commands.command').update(_data='cached')
+        Module.objects.create(path='commands.removed')
+        out = six.StringIO()
+        load_docs_path = 'polemarch.main.models.projects.ModulesQuerySet.load_docs'
+        with patch(load_docs_path) as load_docs:
+            call_command('update_ansible_modules', yes=True, stdout=out)
+            self.assertEqual(load_docs.call_count, 1)
+        self.assertIn('Added: 0, removed: 1, changed: 1, unchanged: ', out.getvalue())
+        new_ping = Module.objects.get(path='system.ping', project=None)
+        self.assertEqual(new_ping.id, ping.id)
+        self.assertEqual(new_ping.data, ping_data)
+        self.assertEqual(Module.objects.get(path='commands.command')._data, 'cached')
+        self.assertFalse(Module.objects.filter(path='commands.removed').exists())
+        shell = Module.objects.get(path='commands.shell')
+        self.assertEqual(shell._data, '{}')
+        self.assertNotEqual(shell.source_hash, 'old')
+
+    def test_modules_docs(self):
+        call_command('update_ansible_modules', interactive=False, stdout=six.StringIO())
+        # Docs are loaded in background after update
+        self.assertFalse(Module.objects.filter(project=None, _data='{}').exists())
+        modules = ['system.ping', 'commands.shell']
+        Module.objects.filter(path__in=modules).update(_data='{}')
+        out = six.StringIO()
+        with patch('polemarch.main.utils.AnsibleModulesDocs.get_docs') as get_docs:
+            get_docs.return_value = {'system.ping': 'module: ping'}
+            call_command('update_ansible_modules', load_docs=True, stdout=out)
+            self.assertEqual(
+                set(call[0][0] for call in get_docs.call_args_list),
+                {'system', 'commands'}
+            )
+        self.assertIn('Docs of 1 modules have been loaded.', out.getvalue())
+        self.assertEqual(Module.objects.get(path='system.ping').data['module'], 'ping')
+
+    def test_config_parser_cache(self):
+        first_dir, second_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        try:
+            parser = AnsibleConfigParser(first_dir)
+            key = parser.get_fingerprint()
+            self.assertEqual(key, AnsibleConfigParser(first_dir).get_fingerprint())
+            self.assertNotEqual(key, AnsibleConfigParser(second_dir).get_fingerprint())
+            with patch.dict(os.environ, ANSIBLE_FORKS='10'):
+                self.assertNotEqual(key, parser.get_fingerprint())
+            with open(os.path.join(first_dir, 'ansible.cfg'), 'w') as fd:
+                fd.write('[defaults]\nforks = 10\n')
+            key = parser.get_fingerprint()
+            self.assertNotEqual(key, AnsibleConfigParser(second_dir).get_fingerprint())
+            data = parser.get_data()
+            # Unchanged config is not parsed again
+            with patch('polemarch.main.utils.CmdExecutor.execute') as execute:
+                self.assertEqual(AnsibleConfigParser(first_dir).get_data(), data)
+                self.assertEqual(execute.call_count, 0)
+        finally:
+            shutil.rmtree(first_dir)
+            shutil.rmtree(second_dir)
 
     def test_inventory_parser(self):
         parser = AnsibleInventoryParser()
@@ -1,3 +1,12 @@
+import json
+import base64
+try:
+    from mock import patch
+except ImportError:  # nocv
+    from unittest.mock import patch
+from django.db import connection
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
 from ..tests._base import BaseTestCase
 
 
@@ -8,3 +17,206 @@ class UsersTestCase(BaseTestCase):
         test_settings.data = 'something for test'
         del(test_settings.data)
         self.assertEqual(test_settings.data, {})
+
+
+class VariablesQueriesTestCase(BaseTestCase):
+
+    def _count_list_queries(self, client, name):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.result(client.get, self.get_url(name))
+        return len(queries), result['count']
+
+    def _create_objects(self, model_name, count, **kwargs):
+        model = self.get_model_class(model_name)
+        for _ in range(count):
+            obj = model.objects.create(**kwargs)
+            obj.set_vars(dict(ansible_user='user', ansible_port='22', repo_type='MANUAL'))
+
+    def test_list_queries(self):
+        client = self._login()
+        for name, model_name in (('host', 'Host'), ('group', 'Group'),
+                                 ('inventory', 'Inventory'), ('project', 'Project')):
+            self._create_objects(model_name, 2)
+            queries_number, count = self._count_list_queries(client, name)
+            self._create_objects(model_name, 4)
+            self.assertEqual(
+                self._count_list_queries(client, name), (queries_number, count + 4), name
+            )
+
+    def test_inventory_queries(self):
+        inventory = self.get_model_class('Inventory').objects.create()
+        Host = self.get_model_class('Host')
+        Group = self.get_model_class('Group')
+
+        def add_objects(count):
+            group = Group.objects.create(name='group-{}'.format(Group.objects.count()))
+            group.set_vars(dict(ansible_user='user'))
+            inventory.groups.add(group)
+            for _ in range(count):
+                host = Host.objects.create(name='host-{}'.format(Host.objects.count()))
+                host.set_vars(dict(ansible_host='10.10.10.10', ansible_port='22'))
+                inventory.hosts.add(host)
+                group.hosts.add(host)
+
+        add_objects(2)
+        inventory.get_inventory()
+        with CaptureQueriesContext(connection) as queries:
+            inventory.get_inventory()
+        add_objects(8)
+        # Only hosts of new group are fetched, variables are taken from snapshots.
+        with self.assertNumQueries(len(queries) + 1):
+            inventory.get_inventory()
+
+
+class ConditionalGetTestCase(BaseTestCase):
+
+    def _get(self, client, url, etag=None, code=200):
+        headers = dict(HTTP_IF_NONE_MATCH=etag) if etag else dict()
+        response = client.get(url, **headers)
+        self.assertEqual(response.status_code, code, response.content)
+        return response
+
+    def _check_etag(self, client, url, change):
+        etag = self._get(client, url)['ETag']
+        # Object is not serialized.
+        with patch('vstutils.api.base.ModelViewSetSet.retrieve') as retrieve:
+            self.assertEqual(self._get(client, url, etag, 304)['ETag'], etag)
+            self.assertEqual(retrieve.call_count, 0)
+        self._get(client, url, '"other", {}'.format(etag), 304)
+        change()
+        new_etag = self._get(client, url, etag, 200)['ETag']
+        self.assertNotEqual(new_etag, etag)
+        return new_etag
+
+    def test_inventory(self):
+        client = self._login()
+        inventory = self.get_model_class('Inventory').objects.create(name='etag')
+        url = self.get_url('inventory', inventory.id)
+
+        def change_notes():
+            inventory.notes = 'Changed'
+            inventory.save()
+
+        def change_owner():
+            inventory.owner.first_name = 'Changed'
+            inventory.owner.save()
+
+        self._check_etag(client, url, change_notes)
+        self._check_etag(client, url, change_owner)
+
+    def test_project(self):
+        client = self._login()
+        project = self.get_model_class('Project').objects.create(name='etag')
+        url = self.get_url('project', project.id)
+        # Files of manual project could be changed without revision.
+        self.assertNotIn('ETag', self._get(client, url))
+        revision = 'abc'
+        revision_method = 'polemarch.main.repo.manual.Manual.get_local_revision'
+        with patch(revision_method) as local_revision:
+            local_revision.side_effect = lambda: revision
+            self._check_etag(
+                client, url, lambda: project.set_vars(dict(repo_branch='other'))
+            )
+            self._check_etag(
+                client, url,
+                lambda: project.variables.create(key='repo_branch', value='new')
+            )
+
+            def change_revision():
+                local_revision.side_effect = lambda: 'def'
+
+            self._check_etag(client, url, change_revision)
+
+    def test_history(self):
+        client = self._login()
+        project = self.get_model_class('Project').objects.create(name='etag')
+        history = self.get_model_class('History').objects.create(
+            project=project, mode='main.yml', status='OK',
+            start_time=timezone.now(), stop_time=timezone.now()
+        )
+
+        def change_status():
+            history.status = 'ERROR'
+            history.save()
+
+        self._check_etag(client, self.get_url('history', history.id), change_status)
+        self._check_etag(
+            client, self.get_url('project', project.id, 'history/{}'.format(history.id)),
+            change_status
+        )
+        history.status = 'RUN'
+        history.save()
+        self.assertNotIn('ETag', self._get(client, self.get_url('history', history.id)))
+
+    def test_not_stamped(self):
+        host = self.get_model_class('Host').objects.create(name='host')
+        with patch('polemarch.main.models.VersionStamp.update') as update:
+            host.set_vars(dict(ansible_user='one'))
+            host.variables.create(key='ansible_port', value='22')
+            self.assertEqual(update.call_count, 0)
+
+
+class KeysetPaginationTestCase(BaseTestCase):
+
+    def _pages(self, client, url, link='next', key=lambda item: item['id']):
+        ids, pages = [], 0
+        while url:
+            result = self.result(client.get, url)
+            self.assertNotIn('count', result)
+            ids += [key(item) for item in result['results']]
+            url, pages = result[link], pages + 1
+        return ids, pages
+
+    def test_history(self):
+        client = self._login()
+        project = self.get_model_class('Project').objects.create(name='keyset')
+        History = self.get_model_class('History')
+        start_time = timezone.now()
+        for i in range(8):
+            # Same start time for several executions.
+            History.objects.create(
+                project=project, mode='main.yml', status='OK',
+                start_time=start_time - timezone.timedelta(seconds=i // 3)
+            )
+        url = self.get_url('project', project.id, 'history')
+        expected = list(
+            History.objects.order_by('-start_time', '-id').values_list('id', flat=True)
+        )
+        ids, pages = self._pages(client, url + '?cursor=&limit=3')
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+        result = self.result(client.get, url + '?cursor=&limit=3')
+        result = self.result(client.get, result['next'])
+        last_page = self.result(client.get, result['next'])
+        self.assertIsNone(last_page['next'])
+        # Back from the last page to the first.
+        ids, pages = self._pages(client, last_page['previous'], 'previous')
+        self.assertEqual(ids, expected[3:6] + expected[:3])
+        self.result(client.get, url + '?cursor=invalid', 404)
+
+    def test_lines(self):
+        client = self._login()
+        project = self.get_model_class('Project').objects.create(name='keyset')
+        history = self.get_model_class('History').objects.create(
+            project=project, mode='main.yml', status='OK'
+        )
+        self.get_model_class('HistoryLines').objects.bulk_create([
+            self.get_model_class('HistoryLines')(
+                history=history, line='{}\n'.format(i),
+                line_gnumber=i // 2, line_number=i % 2
+            )
+            for i in range(10)
+        ])
+        url = self.get_url('history', history.id, 'lines')
+        key = lambda item: (item['line_gnumber'], item['line_number'])
+        expected = [key(item) for item in self.result(client.get, url)['results']]
+        self.assertEqual(expected[0], (4, 1))
+        ids, pages = self._pages(client, url + '?cursor=&limit=4', key=key)
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+        # Cursors with values of wrong types or count.
+        for position in (['abc', 'x'], [None, 1], [1], [[1], {}]):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps(dict(p=position, r=False)).encode('utf-8')
+            ).decode('ascii')
+            self.result(client.get, url + '?cursor={}'.format(cursor), 404)
@@ -1,15 +1,33 @@
 import os
 import json
+import time
+import uuid
+import threading
+from datetime import timedelta
 try:
-    from mock import patch
+    from mock import patch, Mock
 except ImportError:  # nocv
-    from unittest.mock import patch
-from django.test import TestCase
+    from unittest.mock import patch, Mock
+from django.db import transaction, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
 from django.conf import settings
+from django.core.cache import caches
 from django.core.validators import ValidationError
+from six.moves.BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib.parse import parse_qs
 from requests import Response
 from vstutils.utils import raise_context
-from polemarch.main.models import Hook
+from polemarch.main.models import (
+    Hook, HookEvent, HookEventsBatch, HooksCache, Host, Group
+)
+from polemarch.main.models.utils import AnsibleCommand
+from polemarch.main.hooks import http, script
+from polemarch.main.tasks import DeliverHookEvent, SweepHookEvents
+from polemarch.main.middleware import HooksBatchMiddleware
 
 
 class HooksTestCase(TestCase):
@@ -17,27 +35,21 @@ class HooksTestCase(TestCase):
         super(HooksTestCase, self).setUp()
         self.scripts = ['test.sh', 'send.sh']
         self.scripts = ['{}/{}'.format(settings.HOOKS_DIR, s) for s in self.scripts]
-        for script in self.scripts:
-            with open(script, 'w') as file:
+        for path in self.scripts:
+            with open(path, 'w') as file:
                 file.write("test")
 
     def tearDown(self):
         super(HooksTestCase, self).tearDown()
-        for script in self.scripts:
+        for path in self.scripts:
             with raise_context():
-                os.remove(script)
+                os.remove(path)
 
-    def check_output_run(self, check_data, *args, **kwargs):
-        # pylint: disable=unused-argument
-        rep = str(kwargs['cwd'] or '')
-        rep += '/' if kwargs['cwd'] else ''
-        rep += self.recipients[self.count]
-        self.assertEqual(check_data[0], rep)
-        self.assertEqual(check_data[1], 'on_execution')
-        message = json.loads(kwargs['input'])
-        self.assertEqual(message.get('test', None), 'test')
-        self.assertTrue(kwargs['universal_newlines'])
-        self.count += 1
+    def check_run_script(self, script, when, message):
+        # Scripts are executed simultaneously, so order of calls is not fixed.
+        self.assertIn(script, self.scripts)
+        self.assertEqual(when, 'on_execution')
+        self.assertEqual(json.loads(message).get('test', None), 'test')
         return "Ok"
 
     def check_output_error(self, *args, **kwargs):
@@ -53,9 +65,8 @@ class HooksTestCase(TestCase):
         hook = Hook.objects.create(
             type='SCRIPT', recipients=" | ".join(self.recipients)
         )
-        with patch('subprocess.check_output') as cmd:
-            self.count = 0
-            cmd.side_effect = self.check_output_run
+        with patch('polemarch.main.hooks.script.Backend.run_script') as cmd:
+            cmd.side_effect = self.check_run_script
             self.assertEqual(hook.run(message=dict(test="test")), "Ok\nOk")
             self.assertEqual(cmd.call_count, 2)
             hook.run('on_error', message=dict(test="test"))
@@ -65,13 +76,16 @@ class HooksTestCase(TestCase):
             self.assertEqual(cmd.call_count, 4)
 
     def check_output_run_http(self, method, url, data, **kwargs):
-        # pylint: disable=protected-access, unused-argument
-        self.assertEqual(method, "post")
-        self.check_output_run(
-            [url, data['type']],
-            cwd='', input=json.dumps(data['payload']),
-            universal_newlines=True
-        )
+        # pylint: disable=protected-access
+        # Recipients are sent simultaneously, so order of calls is not fixed.
+        self.assertEqual(method, "POST")
+        self.assertIn(url, self.recipients)
+        self.assertEqual(data['type'], 'on_execution')
+        self.assertEqual(data['payload'].get('test', None), 'test')
+        self.assertEqual(kwargs['timeout'], (
+            settings.HOOKS['HTTP']['OPTIONS']['CONNECT_TIMEOUT'],
+            settings.HOOKS['HTTP']['OPTIONS']['READ_TIMEOUT'],
+        ))
         the_response = Response()
         the_response.reason = "ok"
         the_response.status_code = 200
@@ -83,8 +97,7 @@ class HooksTestCase(TestCase):
         hook = Hook.objects.create(
             type='HTTP', recipients=" | ".join(self.recipients)
         )
-        with patch('requests.api.request') as cmd:
-            self.count = 0
+        with patch('requests.Session.request') as cmd:
             cmd.side_effect = self.check_output_run_http
             result = hook.run(message=dict(test="test"))
             for res in result.split("\n"):
@@ -95,3 +108,467 @@ class HooksTestCase(TestCase):
             cmd.side_effect = self.check_output_error
             self.assertEqual(hook.run(message=dict(test="test")), "Err\nErr")
             self.assertEqual(cmd.call_count, 4)
+
+
+class HooksScriptTestCase(TestCase):
+    def setUp(self):
+        super(HooksScriptTestCase, self).setUp()
+        self.scripts = []
+
+    def tearDown(self):
+        super(HooksScriptTestCase, self).tearDown()
+        for name in self.scripts:
+            with raise_context():
+                os.remove('{}/{}'.format(settings.HOOKS_DIR, name))
+
+    def create_script(self, body):
+        name = '{}.sh'.format(uuid.uuid4().hex)
+        path = '{}/{}'.format(settings.HOOKS_DIR, name)
+        with open(path, 'w') as file:
+            file.write('#!/bin/sh\n{}\n'.format(body))
+        os.chmod(path, 0o755)
+        self.scripts.append(name)
+        return name
+
+    def is_alive(self, pid):
+        # Killed process could stay zombie without parent.
+        try:
+            with open('/proc/{}/stat'.format(pid)) as stat:
+                return stat.read().split()[2] != 'Z'
+        except IOError:
+            return False
+
+    def get_handler(self, *scripts, **options):
+        hook = Hook.objects.create(type='SCRIPT', recipients=" | ".join(scripts))
+        options = dict(settings.HOOKS['SCRIPT']['OPTIONS'], **options)
+        return script.Backend(hook, Hook.handlers.when_types, **options)
+
+    def test_run(self):
+        echo = self.create_script('printf "$1 "; cat')
+        failed = self.create_script('exit 3')
+        handler = self.get_handler(echo, failed, echo, MAX_OUTPUT=20)
+        result = handler.send(dict(test="test"), 'on_object_add').split('\n')
+        self.assertEqual(result[0], 'on_object_add {"test": "test"}'[:20])
+        self.assertEqual(result[2], result[0])
+        self.assertIn('non-zero exit status 3', result[1])
+        self.assertEqual(len(handler.errors), 1)
+
+    def test_timeout(self):
+        pid_file = '{}/{}.pid'.format(settings.HOOKS_DIR, uuid.uuid4().hex)
+        self.addCleanup(os.remove, pid_file)
+        slow = self.create_script('sleep 30 & echo $! > {}; wait'.format(pid_file))
+        workers = settings.HOOKS['SCRIPT']['OPTIONS']['WORKERS']
+        started = time.time()
+        handler = self.get_handler(*[slow] * workers, TIMEOUT=1)
+        result = handler.send(dict(test="test"), 'on_object_add').split('\n')
+        self.assertLess(time.time() - started, workers)
+        self.assertEqual(len(handler.errors), workers)
+        self.assertIn('timed out after', result[0])
+        # Children of script are killed with it.
+        with open(pid_file) as file:
+            pid = int(file.read())
+        for _ in range(50):
+            if not self.is_alive(pid):
+                break
+            time.sleep(0.1)
+        self.assertFalse(self.is_alive(pid))
+
+
+class HookServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Client closes connection on timeout.
+        pass
+
+
+class HookRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        length = int(self.headers['Content-Length'])
+        data = parse_qs(self.rfile.read(length).decode('utf-8'))
+        self.server.requests.append((self.path, self.client_address, data['type'][0]))
+        time.sleep(float(self.path.strip('/') or 0))
+        body = self.path.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class HooksHTTPServerTestCase(TestCase):
+    def setUp(self):
+        super(HooksHTTPServerTestCase, self).setUp()
+        self.server = HookServer(('127.0.0.1', 0), HookRequestHandler)
+        self.server.requests = []
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        super(HooksHTTPServerTestCase, self).tearDown()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_hook(self, *paths):
+        return Hook.objects.create(type='HTTP', recipients=" | ".join(
+            '{}/{}'.format(self.url, path) for path in paths
+        ))
+
+    def test_parallel(self):
+        workers = settings.HOOKS['HTTP']['OPTIONS']['WORKERS']
+        paths = ['0.3'] * workers
+        hook = self.get_hook(*paths)
+        started = time.time()
+        result = hook.run('on_object_add', message=dict(test="test"))
+        self.assertLess(time.time() - started, 0.3 * workers)
+        self.assertEqual(result.split('\n'), ['200 OK: /0.3'] * workers)
+        self.assertEqual(len(self.server.requests), workers)
+        self.assertEqual(self.server.requests[0][2], 'on_object_add')
+
+    def test_keep_alive(self):
+        hook = self.get_hook('0')
+        hook.run(message=dict(test="test"))
+        hook.run(message=dict(test="test"))
+        # Second message is sent through pooled connection.
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[0][1], self.server.requests[1][1])
+
+    def test_timeout(self):
+        options = dict(settings.HOOKS['HTTP']['OPTIONS'], READ_TIMEOUT=0.1)
+        hook = self.get_hook('0', '1')
+        handler = http.Backend(hook, Hook.handlers.when_types, **options)
+        result = handler.send(dict(test="test"), 'on_object_add').split('\n')
+        self.assertEqual(result[0], '200 OK: /0')
+        self.assertIn('Read timed out', result[1])
+        self.assertEqual(len(handler.errors), 1)
+
+
+@override_settings(HOOKS_ASYNC=True)
+class HooksOutboxTestCase(TransactionTestCase):
+    serialized_rollback = True
+
+    def setUp(self):
+        super(HooksOutboxTestCase, self).setUp()
+        self.hook = Hook.objects.create(
+            type='HTTP', recipients='http://test.lan | https://example.com'
+        )
+
+    def tearDown(self):
+        super(HooksOutboxTestCase, self).tearDown()
+        # Tables are flushed without signals.
+        HooksCache.reset()
+
+    def response(self, status_code):
+        # pylint: disable=protected-access
+        the_response = Response()
+        the_response.reason = "test"
+        the_response.status_code = status_code
+        the_response._content = b'{}'
+        return the_response
+
+    def test_enqueue(self):
+        with patch('polemarch.main.models.hooks.HookEvent.start_delivery') as start:
+            with patch('requests.Session.request') as request:
+                with transaction.atomic():
+                    Hook.objects.all().execute('on_object_add', dict(id=1))
+                    self.assertEqual(start.call_count, 0)
+                self.assertEqual(request.call_count, 0)
+            self.assertEqual(start.call_count, 1)
+        event = HookEvent.objects.get()
+        self.assertEqual(event.get_message(), dict(id=1))
+        self.assertEqual(event.when, 'on_object_add')
+
+    def test_enqueue_broker_error(self):
+        with patch('polemarch.main.models.hooks.HookEvent.start_delivery') as start:
+            start.side_effect = Exception('Broker is not available')
+            with transaction.atomic():
+                Hook.objects.all().execute('on_object_add', dict(id=1))
+            self.assertEqual(start.call_count, 1)
+        # Event is kept and restarted by sweep.
+        event = HookEvent.objects.get()
+        with patch('requests.Session.request') as request:
+            request.side_effect = lambda *args, **kwargs: self.response(200)
+            self.assertEqual(HookEvent.objects.sweep(60), 0)
+            HookEvent.objects.filter(pk=event.pk).update(
+                updated=event.updated - timedelta(seconds=120)
+            )
+            self.assertEqual(HookEvent.objects.sweep(60), 1)
+            self.assertEqual(request.call_count, 2)
+        self.assertEqual(HookEvent.objects.count(), 0)
+
+    def test_sweep_task(self):
+        with patch('polemarch.main.models.hooks.HookEvent.start_delivery'):
+            Hook.objects.all().execute('on_object_add', dict(id=1))
+        event = HookEvent.objects.get()
+        with patch('requests.Session.request') as request:
+            request.side_effect = lambda *args, **kwargs: self.response(200)
+            self.assertEqual(SweepHookEvents.delay().get(), 0)
+            age = timedelta(seconds=settings.HOOKS_SWEEP_INTERVAL + 1)
+            HookEvent.objects.filter(pk=event.pk).update(updated=event.updated - age)
+            self.assertEqual(SweepHookEvents.delay().get(), 1)
+            self.assertEqual(request.call_count, 2)
+        self.assertEqual(HookEvent.objects.count(), 0)
+
+    def test_claim(self):
+        with patch('polemarch.main.models.hooks.HookEvent.start_delivery'):
+            Hook.objects.all().execute('on_object_add', dict(id=1))
+        event = HookEvent.objects.get()
+        claimed = HookEvent.objects.claim(event.id)
+        self.assertEqual(claimed.id, event.id)
+        self.assertGreater(claimed.updated, event.updated)
+        # Event claimed by other task is not delivered and not swept.
+        with patch('requests.Session.request') as request:
+            self.assertIsNone(HookEvent.objects.claim(event.id))
+            DeliverHookEvent.delay(event.id)
+            self.assertEqual(HookEvent.objects.sweep(0), 0)
+            self.assertEqual(request.call_count, 0)
+        # Deleted event is skipped.
+        event.delete()
+        with patch('requests.Session.request') as request:
+            DeliverHookEvent.delay(event.id)
+            self.assertEqual(request.call_count, 0)
+
+    def test_retry(self):
+        with patch('requests.Session.request') as request:
+            request.side_effect = [
+                Exception('Err'), self.response(200), self.response(200)
+            ]
+            Hook.objects.all().execute('on_object_add', dict(id=1))
+            # Only failed recipient of hook is sent once more.
+            self.assertEqual(request.call_count, 3)
+            urls = [call[0][1] for call in request.call_args_list]
+            self.assertEqual(set(urls), {'http://test.lan', 'https://example.com'})
+        self.assertEqual(HookEvent.objects.count(), 0)
+
+    def test_drop(self):
+        with patch('requests.Session.request') as request:
+            request.side_effect = lambda *args, **kwargs: self.response(503)
+            Hook.objects.all().execute('on_object_add', dict(id=1))
+            retries = settings.HOOKS_RETRIES
+            self.assertEqual(request.call_count, 2 * (retries + 1))
+        self.assertEqual(HookEvent.objects.count(), 0)
+        with patch('requests.Session.request') as request:
+            request.side_effect = lambda *args, **kwargs: self.response(404)
+            Hook.objects.all().execute('on_object_add', dict(id=1))
+            self.assertEqual(request.call_count, 2)
+        self.assertEqual(HookEvent.objects.count(), 0)
+
+
+@override_settings(HOOKS_COALESCE=True, HOOKS_BATCH_SIZE=2)
+class HooksCoalesceTestCase(TransactionTestCase):
+    serialized_rollback = True
+
+    def setUp(self):
+        super(HooksCoalesceTestCase, self).setUp()
+        Hook.objects.create(type='HTTP', recipients='http://test.lan')
+
+    def tearDown(self):
+        super(HooksCoalesceTestCase, self).tearDown()
+        HooksCache.reset()
+
+    def get_messages(self, execute):
+        return [
+            (call[0][0], [(t['type'], t['name']) for t in call[0][1]['targets']])
+            for call in execute.call_args_list
+        ]
+
+    def test_coalesce(self):
+        with patch('polemarch.main.models.hooks.HooksQuerySet.execute'):
+            removed = Host.objects.create(name='removed')
+        with patch('polemarch.main.models.hooks.HooksQuerySet.execute') as execute:
+            with HookEventsBatch.atomic():
+                hosts = [Host.objects.create(name='host{}'.format(i)) for i in range(3)]
+                hosts[0].set_vars(dict(ansible_user='one', ansible_port='22'))
+                hosts[1].variables.create(key='ansible_user', value='two')
+                removed.variables.create(key='ansible_user', value='three')
+                removed.delete()
+                temporary = Group.objects.create(name='temporary')
+                temporary.delete()
+                self.assertEqual(execute.call_count, 0)
+        self.assertEqual(self.get_messages(execute), [
+            ('on_object_add', [('Host', 'host0'), ('Host', 'host1')]),
+            ('on_object_add', [('Host', 'host2')]),
+            ('on_object_del', [('Host', 'removed')]),
+        ])
+
+    def test_rollback(self):
+        with patch('polemarch.main.models.hooks.HooksQuerySet.execute'):
+            host = Host.objects.create(name='host')
+        with patch('polemarch.main.models.hooks.HooksQuerySet.execute') as execute:
+            for atomic in (transaction.atomic, HookEventsBatch.atomic):
+                with self.assertRaises(ValueError):
+                    with atomic():
+                        Host.objects.create(name='rolledback')
+                        raise ValueError
+            with transaction.atomic():
+                host.set_vars(dict(ansible_user='one'))
+            # Without transaction every event is sent at once.
+            host.delete()
+        self.assertEqual(self.get_messages(execute), [
+            ('on_object_upd', [('Host', 'host')]),
+            ('on_object_del', [('Host', 'host')]),
+        ])
+
+    def test_savepoint_rollback(self):
+        with patch('polemarch.main.models.hooks.HooksQuerySet.execute'):
+            host = Host.objects.create(name='host')
+        with patch('polemarch.main.models.hooks.HooksQuerySet.execute') as execute:
+            with HookEventsBatch.atomic():
+                Host.objects.create(name='kept')
+                with self.assertRaises(ValueError):
+                    with transaction.atomic():
+                        Host.objects.create(name='rolledback')
+                        host.delete()
+                        raise ValueError
+                with self.assertRaises(ValueError):
+                    with transaction.atomic():
+                        # Nested block is rolled back with outer savepoint.
+                        with HookEventsBatch.atomic():
+                            Host.objects.create(name='nested')
+                        raise ValueError
+                with transaction.atomic():
+                    Host.objects.create(name='released')
+        self.assertEqual(self.get_messages(execute), [
+            ('on_object_add', [('Host', 'kept'), ('Host', 'released')]),
+        ])
+
+    def test_request_batch(self):
+        def view(request):
+            # pylint: disable=unused-argument
+            Host.objects.create(name='first')
+            Host.objects.get(name='first').delete()
+            Host.objects.create(name='second')
+            Host.objects.create(name='third')
+            return HttpResponse()
+
+        with patch('polemarch.main.models.hooks.HooksQuerySet.execute') as execute:
+            HooksBatchMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(self.get_messages(execute), [
+            ('on_object_add', [('Host', 'second'), ('Host', 'third')]),
+        ])
+
+    def get_outbox(self):
+        return [
+            (event.when, [target['name'] for target in event.get_message()['targets']])
+            for event in HookEvent.objects.order_by('id')
+        ]
+
+    @override_settings(HOOKS_ASYNC=True)
+    def test_outbox(self):
+        with patch('polemarch.main.models.hooks.HookEvent.start_delivery') as start:
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as queries:
+                    with HookEventsBatch.atomic():
+                        for i in range(5):
+                            Host.objects.create(name='host{}'.format(i))
+                        self.assertEqual(HookEvent.objects.count(), 0)
+                # Messages are saved to outbox once before commit.
+                writes = [
+                    query for query in queries
+                    if 'hookevent' in query['sql'].lower() and
+                    not query['sql'].startswith('SELECT')
+                ]
+                self.assertEqual(len(writes), 3)
+                self.assertEqual(HookEvent.objects.count(), 3)
+                self.assertEqual(start.call_count, 0)
+            self.assertEqual(start.call_count, 3)
+        self.assertEqual(self.get_outbox(), [
+            ('on_object_add', ['host0', 'host1']),
+            ('on_object_add', ['host2', 'host3']),
+            ('on_object_add', ['host4']),
+        ])
+
+    @override_settings(HOOKS_ASYNC=True)
+    def test_outbox_savepoint_rollback(self):
+        with patch('polemarch.main.models.hooks.HookEvent.start_delivery'):
+            with HookEventsBatch.atomic():
+                hosts = [Host.objects.create(name='host{}'.format(i)) for i in range(2)]
+                with self.assertRaises(ValueError):
+                    with transaction.atomic():
+                        hosts[1].delete()
+                        Host.objects.create(name='rolledback')
+                        raise ValueError
+            # Outbox is rebuilt without events of rolled back savepoint.
+            self.assertEqual(self.get_outbox(), [('on_object_add', ['host0', 'host1'])])
+            with self.assertRaises(ValueError):
+                with HookEventsBatch.atomic():
+                    Host.objects.create(name='rolledback')
+                    raise ValueError
+        self.assertEqual(self.get_outbox(), [('on_object_add', ['host0', 'host1'])])
+
+
+class HooksCacheTestCase(TransactionTestCase):
+    serialized_rollback = True
+
+    def tearDown(self):
+        super(HooksCacheTestCase, self).tearDown()
+        HooksCache.reset()
+
+    def get_ids(self, when):
+        return [hook.id for hook in HooksCache.get(when)]
+
+    def test_cache(self):
+        HooksCache.reset()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_ids('on_object_add'), [])
+            self.assertFalse(Hook.objects.has_hooks('on_user_add'))
+        common = Hook.objects.create(type='HTTP', recipients='http://test.lan').id
+        add = Hook.objects.create(
+            type='HTTP', recipients='http://test.lan', when='on_object_add'
+        ).id
+        Hook.objects.create(
+            type='HTTP', recipients='http://test.lan', when='on_object_del', enable=False
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_ids('on_object_add'), [common, add])
+            self.assertEqual(self.get_ids('on_object_del'), [common])
+        # Other process changed hooks.
+        HooksCache.data[1].pop(None)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_ids('on_object_del'), [])
+        caches['default'].set(HooksCache.version_key, 'other')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_ids('on_object_del'), [common])
+        # Uncommitted hooks are not cached.
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                Hook.objects.get(id=common).delete()
+                self.assertEqual(self.get_ids('on_object_add'), [add])
+                raise ValueError
+        self.assertEqual(self.get_ids('on_object_add'), [common, add])
+        Hook.objects.get(id=common).delete()
+        self.assertEqual(self.get_ids('on_object_add'), [add])
+
+    def test_savepoint_rollback(self):
+        HooksCache.reset()
+        first = Hook.objects.create(type='HTTP', recipients='http://test.lan').id
+        self.assertEqual(self.get_ids('on_object_add'), [first])
+        with transaction.atomic():
+            with self.assertRaises(ValueError):
+                with transaction.atomic():
+                    Hook.objects.get(id=first).delete()
+                    raise ValueError
+            second = Hook.objects.create(type='HTTP', recipients='http://test.lan').id
+            with self.assertNumQueries(1):
+                self.assertEqual(self.get_ids('on_object_add'), [first, second])
+        # Commit of hooks changed after rolled back savepoint resets cache.
+        self.assertEqual(self.get_ids('on_object_add'), [first, second])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_ids('on_object_add'), [first, second])
+
+    def test_skip_message(self):
+        command = Mock()
+        with patch('polemarch.main.models.hooks.HooksQuerySet.execute') as execute:
+            AnsibleCommand._send_hook(command, 'on_execution')
+            self.assertEqual(command.history.get_hook_data.call_count, 0)
+            Host.objects.create(name='skip')
+            self.assertEqual(execute.call_count, 0)
+            Hook.objects.create(type='HTTP', recipients='http://test.lan')
+            Host.objects.create(name='host')
+            self.assertEqual(execute.call_count, 1)
@@ -1,3 +1,14 @@
+from collections import OrderedDict
+import six
+try:
+    from mock import patch
+except ImportError:  # nocv
+    from unittest.mock import patch
+from django.core.validators import ValidationError
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction, IntegrityError
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from ..tests._base import BaseTestCase
 
 
@@ -11,3 +22,106 @@ class ModelsTestCase(BaseTestCase):
         self.assertEqual(class_handler.model, ObjClass)
         self.assertEqual(object_handler.instance, obj)
         self.assertEqual(object_handler.model, ObjClass)
+
+    def test_set_vars(self):
+        host = self.get_model_class("Host").objects.create(name='bulk-vars')
+        variables = {'var_{}'.format(i): str(i) for i in range(50)}
+        variables['ansible_host'] = '10.10.10.10'
+        # New objects have empty snapshot, which is not rebuilt on read.
+        with self.assertNumQueries(0):
+            self.assertEqual(host.vars, {})
+        ContentType.objects.get_for_model(host)
+        with patch('polemarch.main.models.send_polemarch_models') as hook:
+            # Delete, insert and snapshot rebuild under lock in savepoint.
+            with self.assertNumQueries(7):
+                host.set_vars(variables)
+            self.assertEqual(hook.call_count, 1)
+            self.assertEqual(hook.call_args[0], ('on_object_upd', host))
+        self.assertEqual(host.vars, variables)
+        # Encrypted values keep old variables.
+        host.set_vars({'ansible_host': '[~~ENCRYPTED~~]', 'var_0': 'new'})
+        self.assertEqual(host.vars, {'ansible_host': '10.10.10.10', 'var_0': 'new'})
+        # All variables are validated before any change.
+        with self.assertRaises(ValidationError):
+            host.set_vars({'var_1': '1', 'ansible_host': '^invalid'})
+        self.assertEqual(host.vars, {'ansible_host': '10.10.10.10', 'var_0': 'new'})
+
+    def test_variables_upsert(self):
+        host = self.get_model_class("Host").objects.create(name='upsert-vars')
+        first = host.variables.create(key='ansible_port', value='22')
+        second = host.variables.create(key='ansible_port', value='222')
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(host.variables.count(), 1)
+        self.assertEqual(host.vars, {'ansible_port': '222'})
+        Variable = self.get_model_class("Variable")
+        third = Variable.objects.create(
+            content_object=host, key='ansible_port', value='2222'
+        )
+        self.assertEqual(first.id, third.id)
+        self.assertEqual(host.vars, {'ansible_port': '2222'})
+        # Values are validated on update too.
+        with self.assertRaises(ValidationError):
+            host.variables.create(key='ansible_host', value='^invalid')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Variable(content_object=host, key='ansible_port', value='22').save()
+
+    def test_vars_snapshot(self):
+        Host = self.get_model_class("Host")
+        host = Host.objects.create(name='snapshot-vars')
+        self.assertEqual(host.vars_snapshot, '{}')
+        host.set_vars(OrderedDict([('var', '1'), ('ansible_port', '22')]))
+        self.assertEqual(list(Host.objects.get(pk=host.pk).vars), ['ansible_port', 'var'])
+        # Object which variables are changed through, is updated too.
+        host.variables.create(key='ansible_host', value='10.10.10.10')
+        self.assertEqual(list(host.vars), ['ansible_host', 'ansible_port', 'var'])
+        host.variables.filter(key='var').delete()
+        host = Host.objects.get(pk=host.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                host.vars, {'ansible_host': '10.10.10.10', 'ansible_port': '22'}
+            )
+        # Bulk update of variables resets snapshots.
+        host.variables.filter(key='ansible_port').update(value='222')
+        self.assertEqual(host.vars['ansible_port'], '222')
+        self.assertEqual(Host.objects.get(pk=host.pk).vars['ansible_port'], '222')
+        # Checker finds and fixes inconsistent snapshots.
+        Host.objects.filter(pk=host.pk).update(vars_snapshot='{}')
+        out = six.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('check_vars_snapshots', stdout=out)
+        self.assertIn('Host snapshot-vars ({})'.format(host.id), out.getvalue())
+        call_command('check_vars_snapshots', fix=True, stdout=out)
+        call_command('check_vars_snapshots', stdout=out)
+        self.assertEqual(len(Host.objects.get(pk=host.pk).vars), 2)
+
+    def test_stale_save(self):
+        Host = self.get_model_class("Host")
+        host = Host.objects.create(name='stale-host')
+        Host.objects.get(pk=host.pk).variables.create(key='ansible_port', value='22')
+        # Stale object doesn't overwrite snapshot of other objects.
+        host.notes = 'changed'
+        host.save()
+        host = Host.objects.get(pk=host.pk)
+        self.assertEqual(host.notes, 'changed')
+        self.assertEqual(host.vars, {'ansible_port': '22'})
+        Project = self.get_model_class("Project")
+        project = Project.objects.create(name='stale-project')
+        Project.objects.get(pk=project.pk).set_vars(dict(repo_type='MANUAL'))
+        project.set_status('OK')
+        project = Project.objects.get(pk=project.pk)
+        self.assertEqual(project.status, 'OK')
+        self.assertEqual(project.vars['repo_type'], 'MANUAL')
+
+    def test_var_filter(self):
+        Host = self.get_model_class("Host")
+        for i in range(6):
+            host = Host.objects.create(name='filter-{}'.format(i))
+            host.set_vars(dict(a=str(i % 2), b=str(i % 3), c='1'))
+        group = self.get_model_class("Group").objects.create(name='filter-group')
+        group.set_vars(dict(a='0', b='0', c='1'))
+        hosts = Host.objects.filter(name__startswith='filter-')
+        filtered = hosts.var_filter(a='0', b='0', c='1')
+        self.assertEqual(list(filtered.values_list('name', flat=True)), ['filter-0'])
+        self.assertEqual(hosts.var_filter(a='1', c='1').count(), 3)
+        self.assertEqual(hosts.var_filter(a='1', d='1').count(), 0)
+        self.assertEqual(hosts.var_filter().count(), 6)
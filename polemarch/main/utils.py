@@ -9,6 +9,8 @@ import sys
 import os
 import re
 import json
+import uuid
+import hashlib
 from os.path import dirname
 try:
     from Queue import Queue
@@ -248,12 +250,40 @@ class SubCacheInterface(PMObject):
         self.set(None)
 
 
+class VersionStamp(SubCacheInterface):
+    '''
+    Cheap version of model object for ETags of API responses.
+    Stamp is changed by models signals, lost stamp is generated again
+    and only makes clients to load object once more.
+    '''
+    __slots__ = ()
+    cache_name = "version"
+
+    def __init__(self, model, pk):
+        prefix = '{}-{}'.format(model._meta.label_lower, pk)
+        super(VersionStamp, self).__init__(prefix, timeout=None)
+
+    def get(self):
+        '''
+        :return: -- stamp or None if cache could not keep it.
+        :rtype: str
+        '''
+        value = self.cache.get(self.key)
+        if value is None:
+            self.cache.add(self.key, uuid.uuid4().hex, self.timeout)
+            value = self.cache.get(self.key)
+        return value
+
+    def update(self):
+        self.cache.set(self.key, uuid.uuid4().hex, self.timeout)
+
+
 class AnsibleCache(SubCacheInterface):
     cache_name = "ansible"
 
 
 class PMAnsible(PMObject):
-    __slots__ = 'execute_path', 'cache',
+    __slots__ = 'execute_path',
     # Json regex
     _regex = re.compile(r"([\{\[][^\w\d\.].*[\}\]]$)", re.MULTILINE)
     ref_name = 'object'
@@ -262,10 +292,19 @@ class PMAnsible(PMObject):
     def __init__(self, execute_path='/tmp/'):
         self.execute_path = execute_path
 
-    def get_ansible_cache(self):
-        if not hasattr(self, 'cache'):
-            self.cache = AnsibleCache(self.get_ref(cache=True), self.cache_timeout)
-        return self.cache
+    def get_ansible_cache(self, cache_key=''):
+        '''
+        Cache of `pm_ansible` output.
+
+        :param cache_key: suffix of cache name or None for uncached data.
+        :rtype: AnsibleCache, None
+        '''
+        if cache_key is None:
+            return None
+        ref = self.get_ref(cache=True)
+        if cache_key:
+            ref += '-{}'.format(cache_key)
+        return AnsibleCache(ref, self.cache_timeout)
 
     def _get_only_json(self, output):
         return json.loads(self._regex.findall(output)[0])
@@ -279,20 +318,21 @@ class PMAnsible(PMObject):
     def get_args(self):
         return self.pm_ansible(self.get_ref())
 
-    def get_data(self):
-        cache = self.get_ansible_cache()
-        result = cache.get()
+    def get_data(self, cache_key=''):
+        cache = self.get_ansible_cache(cache_key)
+        result = cache.get() if cache is not None else None
         if result is None:
             with open(os.devnull, 'wb') as DEVNULL:
                 cmd = CmdExecutor(stderr=DEVNULL)
                 cmd_command = self.get_args()
                 cmd.execute(cmd_command, self.execute_path)
             result = self._get_only_json(cmd.output)
-            cache.set(result)
+            if cache is not None:
+                cache.set(result)
         return result
 
-    def clear_cache(self):
-        self.get_ansible_cache().clear()
+    def clear_cache(self, cache_key=''):
+        self.get_ansible_cache(cache_key).clear()
 
 
 class AnsibleArgumentsReference(PMAnsible):
@@ -361,6 +401,7 @@ class AnsibleArgumentsReference(PMAnsible):
 class AnsibleModules(PMAnsible):
     __slots__ = 'detailed', 'key', 'module_paths'
     ref_name = 'modules'
+    project_prefix = 'polemarch.project.'
 
     def __init__(self, detailed=False, paths=None):
         super(AnsibleModules, self).__init__()
@@ -391,21 +432,63 @@ class AnsibleModules(PMAnsible):
         self.key = None
         return self.get()
 
-    def get(self, key=""):
+    def _get_source_roots(self, module):
+        # pylint: disable=import-error
+        if module.startswith(self.project_prefix) and self.module_paths:
+            return self.module_paths, module[len(self.project_prefix):]
+        from ansible import modules as ansible_modules
+        return [dirname(ansible_modules.__file__)], module
+
+    def get_source_hash(self, module):
+        '''
+        Hash of module source file. Windows modules are hashed
+        by their documentation `.py` files. Project modules are
+        searched in `module_paths`.
+
+        :param module: module path, like `system.ping`.
+        :return: sha1 of source or empty string if source is not found.
+        :rtype: str
+        '''
+        roots, name = self._get_source_roots(module)
+        for root in roots:
+            path = os.path.join(root, *name.split('.'))
+            for source in (path + '.py', path + '.ps1'):
+                with raise_context():
+                    with open(source, 'rb') as fd:
+                        return hashlib.sha1(fd.read()).hexdigest()
+        return ''
+
+    def get(self, key="", cache_key=''):
         self.key = key
-        return self.get_data()
+        return self.get_data(cache_key)
+
+
+class AnsibleModulesDocs(AnsibleModules):
+    '''
+    Detailed data of all modules in namespace in one call without caching.
+    '''
+    __slots__ = ()
+
+    def __init__(self, paths=None):
+        super(AnsibleModulesDocs, self).__init__(detailed=True, paths=paths)
+
+    def get_docs(self, namespace):
+        '''
+        Get docs of modules in namespace.
+
+        :param namespace: top-level part of modules paths, like `cloud`.
+        :return: dict with module path as key and doc data as value.
+        :rtype: dict
+        '''
+        # Key is short, because `pm_ansible` uses it as cache file name.
+        key = r'^{}(\.|$)'.format(re.escape(namespace))
+        return {module['path']: module['doc_data'] for module in self.get(key, None)}
 
 
 class AnsibleInventoryParser(PMAnsible):
     __slots__ = 'path',
     ref_name = 'inventory_parser'
 
-    def get_ansible_cache(self):
-        cache = super(AnsibleInventoryParser, self).get_ansible_cache()
-        cache.get = lambda: None
-        cache.set = lambda value: None
-        return cache
-
     def get_args(self):
         args = super(AnsibleInventoryParser, self).get_args()
         args += [self.path]
@@ -414,8 +497,41 @@ class AnsibleInventoryParser(PMAnsible):
     def get_inventory_data(self, raw_data):
         with tmp_file_context(data=raw_data) as tmp_file:
             self.path = tmp_file.name
-            return self.get_data()
+            return self.get_data(cache_key=None)
 
 
 class AnsibleConfigParser(PMAnsible):
+    '''
+    Parser of ansible config for directory (`execute_path`).
+    Result is cached by directory, content of config files
+    and ansible environment variables, so config is parsed again
+    only when it was changed.
+    '''
     ref_name = 'config'
+    env_prefix = 'ANSIBLE_'
+
+    def _get_config_files(self):
+        return [
+            os.environ.get('ANSIBLE_CONFIG', None),
+            os.path.join(self.execute_path, 'ansible.cfg'),
+            os.path.expanduser('~/.ansible.cfg'),
+            '/etc/ansible/ansible.cfg',
+        ]
+
+    def get_fingerprint(self):
+        fingerprint = hashlib.sha1(self.execute_path.encode('utf-8'))
+        for config_file in filter(bool, self._get_config_files()):
+            with raise_context():
+                with open(config_file, 'rb') as fd:
+                    fingerprint.update(config_file.encode('utf-8'))
+                    fingerprint.update(fd.read())
+        for key, value in sorted(os.environ.items()):
+            if key.startswith(self.env_prefix):
+                fingerprint.update('{}={}'.format(key, value).encode('utf-8'))
+        return fingerprint.hexdigest()
+
+    def get_data(self, cache_key=''):
+        # Config could be changed during lifetime of object.
+        return super(AnsibleConfigParser, self).get_data(
+            cache_key or self.get_fingerprint()
+        )